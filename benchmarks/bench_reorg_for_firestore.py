@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Benchmarks reorg_for_firestore and add_manual_additions_to_ontology_lookup on a
+synthetic ontology catalog, against the previous row-by-row implementations.
+
+The previous reorg_for_firestore is quadratic in the number of ontologies per api,
+so it is compared on a smaller catalog(--legacy-rows). Outputs of both versions
+are checked for equality, as JSON and as csv, before timings are printed.
+
+Run examples
+`python benchmarks/bench_reorg_for_firestore.py`
+`python benchmarks/bench_reorg_for_firestore.py --rows 500000 --legacy-rows 10000`
+Options:
+--rows catalog size for the current implementations
+--legacy-rows catalog size for comparing against the previous implementations
+-n number of runs per measurement
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve() / "src"))
+
+from locutus_util.ontology_api_etl import (reorg_for_firestore,
+                                           add_manual_additions_to_ontology_lookup)
+
+APIS = [
+    ("ols", "https://www.ebi.ac.uk/ols4/api/", "Ontology Lookup Service"),
+    ("umls", "https://uts-ws.nlm.nih.gov/rest/", "UMLS - Unified Medical Language System"),
+    ("monarch", "https://api-v3.monarchinitiative.org/v3/api/search?q=", "Monarch API"),
+]
+MANUAL_CURIES = ["LNC", "OMIM", "MSH", "ORDO"]
+
+
+def synthetic_catalog(rows, seed=0):
+    """
+    An ontology_api.csv shaped catalog. Codes repeat across apis and in mixed case,
+    and some rows have no curie, to exercise the de-duplication rules.
+    """
+    rng = random.Random(seed)
+    codes = [f"ont{i}" for i in range(rows // 2)]
+    records = []
+    for _ in range(rows):
+        api_id, api_url, api_name = rng.choice(APIS)
+        code = rng.choice(codes)
+        code = code.upper() if rng.random() < 0.2 else code
+        curie = rng.choice(MANUAL_CURIES) if rng.random() < 0.01 else code.upper()
+        records.append({
+            "api_url": api_url,
+            "api_id": api_id,
+            "api_name": api_name,
+            "ontology_code": code,
+            "curie": None if rng.random() < 0.05 else curie,
+            "ontology_title": f"Title of {code}",
+            "system": f"http://purl.obolibrary.org/obo/{code}.owl",
+            "version": rng.choice([None, "2024-01-01", "v1"]),
+        })
+    curated = {code.upper() for code in rng.sample(codes, len(codes) // 10)}
+    # Nulls as None, as ontology_api_etl reads the csv
+    df = pd.DataFrame(records).astype(object)
+    return df.where(pd.notnull(df), None), curated
+
+
+def legacy_reorg_for_firestore(filtered_ontologies, curated_list):
+    api_data = {}
+    csv_data = filtered_ontologies.to_dict(orient='records')
+    curated_list = list(curated_list)
+
+    for entry in csv_data:
+        api_id = entry['api_id']
+        ontology_id = entry['ontology_code'].upper()
+
+        if api_id not in api_data:
+            api_data[api_id] = {
+                'api_url': entry['api_url'],
+                'api_name': entry['api_name'],
+                'ontologies': {}
+            }
+
+        api_data_ontologies = {key.upper(): value for key, value in api_data[api_id]['ontologies'].items()}
+        if ontology_id not in api_data_ontologies and entry['curie']:
+            api_data[api_id]["ontologies"][ontology_id] = {
+                "ontology_title": entry["ontology_title"],
+                "ontology_code": entry["ontology_code"].lower(),
+                "curie": entry["curie"].upper(),
+                "system": entry["system"],
+                "version": entry["version"],
+                "short_list": ontology_id in curated_list,
+            }
+    return api_data
+
+
+def legacy_add_manual_additions_to_ontology_lookup(df):
+    manual_map = {"LOINC": "LNC", "MIM": "OMIM", "MESH": "MSH", "ORPHANET": "ORDO"}
+    new_rows = []
+    for input_sys, current_sys in manual_map.items():
+        matching_rows = df[df["curie"] == current_sys]
+        for _, row in matching_rows.iterrows():
+            new_row = row.copy()
+            new_row["curie"] = input_sys
+            new_rows.append(new_row)
+    return pd.concat([df, pd.DataFrame(new_rows)], ignore_index=True)
+
+
+def timed(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return result, statistics.median(timings)
+
+
+def compare(name, rows, runs, legacy, current, serialize):
+    legacy_result, legacy_time = timed(legacy, runs)
+    current_result, current_time = timed(current, runs)
+    if serialize(legacy_result) != serialize(current_result):
+        raise SystemExit(f"{name}: output differs from the previous implementation")
+    print(
+        f"{name:<40}{rows:>10,}{legacy_time * 1000:>14.1f}{current_time * 1000:>14.1f}"
+        f"{legacy_time / current_time:>10.1f}x"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ontology_api_etl reorganization steps.")
+    parser.add_argument("--rows", type=int, default=120_000, help="Catalog size")
+    parser.add_argument("--legacy-rows", type=int, default=5_000, help="Catalog size for the previous reorg")
+    parser.add_argument("-n", "--runs", type=int, default=3, help="Runs per measurement")
+    args = parser.parse_args()
+
+    small, small_curated = synthetic_catalog(args.legacy_rows)
+    catalog, curated = synthetic_catalog(args.rows)
+    lookup = catalog[["curie", "system"]]
+
+    print(f"{'step':<40}{'rows':>10}{'previous ms':>14}{'current ms':>14}{'speedup':>11}")
+    compare(
+        "reorg_for_firestore", args.legacy_rows, args.runs,
+        lambda: legacy_reorg_for_firestore(small, small_curated),
+        lambda: reorg_for_firestore(small, small_curated),
+        lambda result: json.dumps(result),
+    )
+    compare(
+        "add_manual_additions_to_ontology_lookup", args.rows, args.runs,
+        lambda: legacy_add_manual_additions_to_ontology_lookup(lookup),
+        lambda: add_manual_additions_to_ontology_lookup(lookup),
+        lambda result: result.to_csv(index=False),
+    )
+
+    _, current_time = timed(lambda: reorg_for_firestore(catalog, curated), args.runs)
+    print(f"{'reorg_for_firestore':<40}{args.rows:>10,}{'-':>14}{current_time * 1000:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Times the fetch and transform stages of ontology_api_etl end to end, offline.
+
+Record the OLS and UMLS responses once on a machine with access(needs UMLS_API_KEY),
+then replay them anywhere. Replayed responses wait as long as the recorded call
+took, unless --latency is given. The response cache is bypassed so every run
+sends the same requests.
+
+The ontology_api and locutus_system_map csvs are written to a temporary directory,
+so data/input is not modified.
+
+Run examples
+`python benchmarks/etl_replay.py --record`
+`python benchmarks/etl_replay.py -n 5`
+`python benchmarks/etl_replay.py --latency 0`
+Options:
+-n number of runs
+--record send real requests and write the fixtures
+--latency seconds per replayed request, instead of the recorded latency
+--fixtures fixture directory(default data/fixtures)
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve() / "src"))
+
+from locutus_util import (OLS_API_BASE_URL, UMLS_API_BASE_URL, MANUAL_ONTOLOGY_TRANSFORMS_PATH,
+                          get_api_key)
+from locutus_util.http_cache import configure_http_cache
+from locutus_util.http_replay import configure_replay, RECORD, REPLAY
+
+
+def run_etl(umls_api_key, output_dir):
+    """The fetch and transform stages of ontology_api_etl. Returns seconds per stage."""
+    import pandas as pd
+    from locutus_util import ontology_api_etl as etl
+
+    timings = {}
+    start = time.perf_counter()
+    ols_data, umls_data = etl.collect_api_data(
+        f"{OLS_API_BASE_URL}ontologies",
+        f"{UMLS_API_BASE_URL}metadata/current/sources?apiKey={umls_api_key}",
+    )
+    timings["fetch"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hc_ontology_data = pd.read_csv(MANUAL_ONTOLOGY_TRANSFORMS_PATH, delimiter=",")
+    combined_data = (
+        ols_data + umls_data + etl.add_monarch_ontologies(ols_data) + etl.add_manual_ontologies()
+    )
+    supplemented_data = etl.supplement_data(combined_data, hc_ontology_data)
+    etl.update_seed_data_csv(
+        supplemented_data, output_dir / "ontology_api.csv", output_dir / "locutus_system_map.csv"
+    )
+    timings["transform"] = time.perf_counter() - start
+
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time ontology_api_etl against recorded API responses.")
+    parser.add_argument("-n", "--runs", type=int, default=3, help="Number of runs")
+    parser.add_argument("--record", action="store_true", help="Send real requests and write the fixtures")
+    parser.add_argument("--latency", type=float, default=None, help="Seconds per replayed request")
+    parser.add_argument("--fixtures", default=None, help="Fixture directory")
+    args = parser.parse_args()
+
+    configure_replay(RECORD if args.record else REPLAY, args.fixtures, args.latency)
+    configure_http_cache(enabled=False)
+    # Replayed requests match on the redacted url, so no key is needed to replay
+    umls_api_key = get_api_key("umls") if args.record else "replay"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        runs = [run_etl(umls_api_key, Path(tmp_dir)) for _ in range(1 if args.record else args.runs)]
+
+    print(f"{'stage':<12}{'min s':>10}{'median s':>12}{'max s':>10}")
+    for stage in runs[0]:
+        timings = [run[stage] for run in runs]
+        print(f"{stage:<12}{min(timings):>10.2f}{statistics.median(timings):>12.2f}{max(timings):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
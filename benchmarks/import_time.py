@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tracks CLI cold-start latency for locutus_util.
+
+Each target is run in a fresh interpreter, so nothing is cached between runs
+except the OS file cache. Imports must not require cloud credentials, a config
+file or a UMLS_API_KEY.
+
+Run examples
+`python benchmarks/import_time.py`
+`python benchmarks/import_time.py -n 20 --importtime`
+Options:
+-n number of runs per target
+--importtime also print the slowest imports (python -X importtime) per target
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).parent.parent.resolve() / "src"
+
+TARGETS = {
+    "import locutus_util": ["-c", "import locutus_util"],
+    "import locutus_util.helpers": ["-c", "import locutus_util.helpers"],
+    "seed_data --help": ["-m", "locutus_util.seed_etl.seed_data_etl", "--help"],
+}
+
+
+def run_target(args, env):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, *args],
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def slowest_imports(args, env, top=10):
+    """Parse `python -X importtime` output and return the slowest cumulative imports."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, package = line[len("import time:"):].split("|")
+        timings.append((int(cumulative), package.strip()))
+    return sorted(timings, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure locutus_util CLI cold-start latency.")
+    parser.add_argument("-n", "--runs", type=int, default=10, help="Runs per target")
+    parser.add_argument("--importtime", action="store_true", help="Print the slowest imports per target")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(SRC_DIR), env.get("PYTHONPATH")]))
+    # Startup must not depend on the UMLS key
+    env.pop("UMLS_API_KEY", None)
+
+    print(f"{'target':<32}{'min ms':>10}{'median ms':>12}{'max ms':>10}")
+    for name, target_args in TARGETS.items():
+        timings = [run_target(target_args, env) * 1000 for _ in range(args.runs)]
+        print(
+            f"{name:<32}{min(timings):>10.1f}{statistics.median(timings):>12.1f}{max(timings):>10.1f}"
+        )
+
+        if args.importtime:
+            for cumulative, package in slowest_imports(target_args, env):
+                print(f"    {cumulative / 1000:>8.1f} ms  {package}")
+
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,10 @@ INPUT_PATH = Path(f"{DATA_DIR}/input")
 OUTPUT_PATH = Path(f"{DATA_DIR}/output")
 ONTOLOGY_DATA_PATH = Path(f"{INPUT_PATH}/ontology_data")
 SIDELOAD_PATH = Path(f"{INPUT_PATH}/sideload_data")
+CACHE_PATH = Path(f"{DATA_DIR}/cache")
+HTTP_CACHE_PATH = Path(f"{CACHE_PATH}/http_cache.sqlite")
+SEARCH_CACHE_PATH = Path(f"{CACHE_PATH}/search_cache.sqlite")
+FIXTURES_PATH = Path(f"{DATA_DIR}/fixtures")
 
 # Data file paths
 ONTOLOGY_API_PATH = Path(f"{ONTOLOGY_DATA_PATH}/ontology_api.csv")
@@ -39,6 +43,19 @@ LOCUTUS_SYSTEM_MAP_PATH = Path(f"{ONTOLOGY_DATA_PATH}/locutus_system_map.csv")
 BATCH_SIZE = 10
 COL_TIME_LIMIT = 300
 SUB_TIME_LIMIT = 60
+DELETE_PAGE_SIZE = 500  # Document ids listed per page by the delete engine
+DELETE_MAX_WORKERS = 8  # Threads used to traverse subcollections while deleting
+DELETE_MAX_ATTEMPTS = 5  # Attempts per document before a delete is reported as failed
+INVENTORY_PROBE_LIMIT = 20  # Documents per collection probed for subcollection names
+HTTP_MAX_WORKERS = 8  # Concurrent requests, and pooled connections per host
+HTTP_TIMEOUT = 60  # Seconds before an HTTP request is abandoned
+HTTP_MAX_RETRIES = 3  # Retries for 5xx/429 responses in the async seed mode
+HTTP_BACKOFF = 0.5  # Seconds before the first retry, doubled on each retry
+SCAN_PARTITIONS = 16  # Partitions a collection group scan is split into
+SCAN_MAX_WORKERS = 8  # Partitions scanned at once
+HTTP_CACHE_TTL = 86400  # Seconds a cached API response is used before it is revalidated
+SEARCH_CACHE_TTL = 604800  # Seconds an UNKNOWN search result is used before the concept is searched again
+WRITE_BATCH_SIZE = 500  # Writes per WriteBatch commit, the Firestore limit
 
 # Setup Logger
 logger = logging.getLogger()
@@ -56,8 +73,17 @@ console_handler.setFormatter(
 )
 logger.addHandler(console_handler)
 
-# File handler
-file_handler = logging.FileHandler(log_file)
+# File handler. The logs dir and file are only created when the first record is written.
+class DelayedFileHandler(logging.FileHandler):
+    def __init__(self, filename):
+        super().__init__(filename, delay=True)
+
+    def _open(self):
+        Path(self.baseFilename).parent.mkdir(parents=True, exist_ok=True)
+        return super()._open()
+
+
+file_handler = DelayedFileHandler(log_file)
 file_handler.setFormatter(
     logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
 )
@@ -88,13 +114,14 @@ def get_api_key(api_id):
         return API_KEY
 
 
-CONFIGS = {}
+_configs = None
 
 
 def load_configurations():
     """Load configurations from the config file if it exists."""
-    global CONFIGS
+    global _configs
 
+    configs = {}
     try:
         # Ensure the parent directory exists
         if not os.path.exists(os.path.dirname(CONFIG_FILE_PATH)):
@@ -108,48 +135,62 @@ def load_configurations():
             logger.info(f"Configuration file found: '{CONFIG_FILE_PATH}'")
             with open(CONFIG_FILE_PATH, "r") as config_file:
                 try:
-                    CONFIGS = json.load(config_file)
+                    configs = json.load(config_file)
 
                     # Resolve environment variables if any value starts with "$"
-                    for key, value in CONFIGS.items():
+                    for key, value in configs.items():
                         if isinstance(value, str) and value.startswith("$"):
                             env_var = value[1:]
-                            CONFIGS[key] = os.getenv(env_var, value)
+                            configs[key] = os.getenv(env_var, value)
 
                 except json.JSONDecodeError as e:
                     logger.error(
                         f"Error: Configuration file {CONFIG_FILE_PATH} is not in valid JSON format. Error: {str(e)}"
                     )
-                    CONFIGS = {}
+                    configs = {}
         else:
             logger.debug(f"No configuration file found at {CONFIG_FILE_PATH}.")
 
     except Exception as e:
         logger.error(f"Unexpected error while loading configurations: {str(e)}")
-        CONFIGS = {}
+        configs = {}
+
+    _configs = configs
+    return _configs
+
+
+def get_configurations():
+    """Return the configurations, reading the config file on first use."""
+    if _configs is None:
+        load_configurations()
+    return _configs
 
 
-load_configurations()
+def __getattr__(name):
+    # CONFIGS is read from the config file on first access, not at import.
+    if name == "CONFIGS":
+        return get_configurations()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def resolve_environment(env_or_uri):
     """
     Resolve the environment URI from the global configurations or use the provided value.
     """
-    envs = CONFIGS.get("envs", {})
+    envs = get_configurations().get("envs", {})
 
     if env_or_uri is None:
         return "http://localhost:8080"
 
     if env_or_uri in envs:
-        value = CONFIGS["envs"][env_or_uri]
+        value = envs[env_or_uri]
 
         if value.startswith("$"):
             env_var = value[1:]  # Remove the "$" prefix
             value = os.getenv(env_var, value)  # Resolve environment variable
             
         logger.info(
-            f"Environment '{env_or_uri}' found in configuration file. Using value: {CONFIGS["envs"][env_or_uri]}"
+            f"Environment '{env_or_uri}' found in configuration file. Using value: {envs[env_or_uri]}"
         )
         return value
         
@@ -1,29 +1,42 @@
 """
 Gathers metadata of ontologies found in the external apis for analysis.
 
-Returns the summary csvs in the locutus_utilities.data.logs directory
+Returns the summary csvs in the locutus_utilities/data/output directory
+- ontology_definition_{date}.csv Every ontology from each source.
+- formatted_ontology_data_{date}.csv One row per curie, with the system found in
+  each source and the ontology_family.
+
+The catalogs are read through the ontology_api_etl response cache(see http_cache),
+so repeated runs don't download them again.
+
+Run examples
+`python src/locutus_util/analysis/analyze_ontology_data.py`
+`python src/locutus_util/analysis/analyze_ontology_data.py --cache-only`
+Options:
+--cache-only use only cached API responses. No UMLS_API_KEY is needed.
+--cache-ttl seconds a cached API response is used before it is revalidated
+--no-cache always download the API responses
+-o output directory
 
 Jira ticket FD-1381
 """
 
-import requests
-import pandas as pd
+import argparse
+import os
 from datetime import date
+from pathlib import Path
+import pandas as pd
+from locutus_util import logger, OUTPUT_PATH, UMLS_API_BASE_URL, HTTP_CACHE_TTL, get_api_key
+from locutus_util.http_cache import configure_http_cache
 from locutus_util.ontology_api_etl import (
     collect_ols_data,
     collect_umls_data,
 )
-from locutus_util.common import LOGS_PATH
-from pathlib import Path 
 
 JIRA_ISSUES = ["fd1381", "fd1653"]
-export_date = date.today()
-
-ols_data = collect_ols_data()
-umls_data = collect_umls_data()
 
 # Define columns to export
-column_names = [
+COLUMN_NAMES = [
     "api_url",
     "api_id",
     "api_name",
@@ -37,7 +50,7 @@ column_names = [
 
 # Add one-off ontologies FD-1381
 # TODO: If possible eventually remove the hard code.
-manual_addition_ontologies = [
+MANUAL_ADDITION_ONTOLOGIES = [
     [
         "",
         "Manual addition",
@@ -61,80 +74,131 @@ manual_addition_ontologies = [
         "",
     ],
 ]
-# Create a DataFrames with the requested ontologies
-ols_df = pd.DataFrame(ols_data, columns=column_names)
-umls_df = pd.DataFrame(umls_data, columns=column_names)
-additional_df = pd.DataFrame(manual_addition_ontologies, columns=column_names)
 
-# Concatenate the api sourced ontologies with the manually added ontologies.
-print(f"Adding hard coded ontologies count:{len(manual_addition_ontologies)}")
-df = pd.concat([ols_df, umls_df, additional_df], ignore_index=True)
-df = df.sort_values(by=["curie", "api_id"], ascending=True, ignore_index=True)
+NO_SYSTEM = "Present but no system defined"
 
-# Save the DataFrame to a CSV file
-Path(f"{LOGS_PATH}/../output").mkdir(exist_ok=True)
+# Output column of each source, in output order
+SOURCES = ["ols", "umls", "manual_addition"]
+# Sources the ontology_family is taken from, in order of preference
+FAMILY_PRECEDENCE = ["ols", "manual_addition", "umls"]
 
-df.to_csv(f"{LOGS_PATH}/../output/ontology_definition_{export_date}.csv", index=False)
 
-print(f"{len(df)} ontologies saved to ontology_definition_{export_date}.csv")
+def build_source_frames(ols_data, umls_data):
+    """
+    Returns:
+        dict: source > DataFrame of its ontologies, with COLUMN_NAMES.
+    """
+    return {
+        "ols": pd.DataFrame(ols_data, columns=COLUMN_NAMES),
+        "umls": pd.DataFrame(umls_data, columns=COLUMN_NAMES),
+        "manual_addition": pd.DataFrame(MANUAL_ADDITION_ONTOLOGIES, columns=COLUMN_NAMES),
+    }
 
 
-def format_ontology_data(ols_df, umls_df, additional_df):
+def combine_ontology_data(source_frames):
+    """Concatenate the api sourced ontologies with the manually added ontologies."""
+    df = pd.concat(
+        [source_frames[source] for source in SOURCES], ignore_index=True
+    )
+    return df.sort_values(by=["curie", "api_id"], ascending=True, ignore_index=True)
+
+
+def format_ontology_data(source_frames):
     """
     Format the data to include columns for OLS, UMLS, Manual Addition (with their systems),
     and an ontology_family column using coalesce logic.
+
+    The first row of each curie in each source is used. All sources are stacked and
+    pivoted once, into one row per curie.
     """
-    # Combine unique 'curie' values from all data sources
-    combined_df = pd.concat(
-        [ols_df[["curie"]], umls_df[["curie"]], additional_df[["curie"]]],
+    stacked = pd.concat(
+        [
+            source_frames[source][["curie", "system", "ontology_family"]].assign(source=source)
+            for source in SOURCES
+        ],
         ignore_index=True,
-    )
-    combined_df = combined_df.drop_duplicates(subset="curie").reset_index(drop=True)
-
-    # Map the 'system' column from each data source
-    ols_system = ols_df.drop_duplicates(subset="curie").set_index("curie")["system"]
-    ols_system = ols_system.apply(lambda x: x if pd.notna(x) else "Present but no system defined")
-    umls_system = umls_df.drop_duplicates(subset="curie").set_index("curie")["system"]
-    umls_system = umls_system.apply(lambda x: x if pd.notna(x) else "Present but no system defined")
-    manual_system = additional_df.drop_duplicates(subset="curie").set_index("curie")[
-        "system"
-    ]
-    manual_system = manual_system.apply(lambda x: x if pd.notna(x) else "Present but no system defined")
-
-    # Map the 'ontology_family' column from each data source
-    ols_family = ols_df.drop_duplicates(subset="curie").set_index("curie")[
-        "ontology_family"
-    ]
-    umls_family = umls_df.drop_duplicates(subset="curie").set_index("curie")[
-        "ontology_family"
-    ]
-    manual_family = additional_df.drop_duplicates(subset="curie").set_index("curie")[
-        "ontology_family"
-    ]
-
-    # Add the columns to the combined DataFrame
-    combined_df["ols"] = combined_df["curie"].map(ols_system)
-    combined_df["umls"] = combined_df["curie"].map(umls_system)
-    combined_df["manual_addition"] = combined_df["curie"].map(manual_system)
+    ).drop_duplicates(subset=["source", "curie"])
+    stacked["system"] = stacked["system"].fillna(NO_SYSTEM)
+
+    wide = stacked.pivot(index="curie", columns="source", values=["system", "ontology_family"])
+    wide = wide.reindex(columns=pd.MultiIndex.from_product([["system", "ontology_family"], SOURCES]))
+
+    combined_df = wide["system"][SOURCES].copy()
 
     # Add the 'ontology_family' column using coalesce logic
-    combined_df["ontology_family"] = (
-        combined_df["curie"]
-        .map(ols_family)
-        .fillna(combined_df["curie"].map(manual_family))
-        .fillna(combined_df["curie"].map(umls_family))
-    )
-    combined_df = combined_df.sort_values(
-        by=["curie"], ascending=True, ignore_index=True
-    )
+    family = wide["ontology_family"]
+    ontology_family = family[FAMILY_PRECEDENCE[0]]
+    for source in FAMILY_PRECEDENCE[1:]:
+        ontology_family = ontology_family.fillna(family[source])
+    combined_df["ontology_family"] = ontology_family
+
+    combined_df = combined_df.sort_index().rename_axis(None, axis="columns").reset_index()
     return combined_df
 
 
-formatted_df = format_ontology_data(ols_df, umls_df, additional_df)
+def analyze_ontology_data(ols_data, umls_data, output_dir=OUTPUT_PATH, export_date=None):
+    """
+    Write the ontology_definition and formatted_ontology_data csvs.
 
-# Save to CSV if needed
-formatted_df.to_csv(
-    f"{LOGS_PATH}/../output/formatted_ontology_data_{export_date}.csv", index=False
-)
+    Returns:
+        tuple: (ontology definitions DataFrame, formatted DataFrame)
+    """
+    export_date = export_date or date.today()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    source_frames = build_source_frames(ols_data, umls_data)
+
+    logger.info(f"Adding hard coded ontologies count:{len(MANUAL_ADDITION_ONTOLOGIES)}")
+    df = combine_ontology_data(source_frames)
+    df.to_csv(output_dir / f"ontology_definition_{export_date}.csv", index=False)
+    logger.info(f"{len(df)} ontologies saved to ontology_definition_{export_date}.csv")
+
+    formatted_df = format_ontology_data(source_frames)
+    formatted_df.to_csv(output_dir / f"formatted_ontology_data_{export_date}.csv", index=False)
+    logger.info(f"Formatted data saved to formatted_ontology_data_{export_date}.csv")
+
+    return df, formatted_df
+
+
+def main(cache_only=False, cache_ttl=HTTP_CACHE_TTL, use_cache=True, output_dir=OUTPUT_PATH):
+    configure_http_cache(enabled=use_cache, ttl=cache_ttl, cache_only=cache_only)
+
+    # Cached responses are keyed by the redacted url, so any key finds them
+    umls_api_key = (os.getenv("UMLS_API_KEY") or "REDACTED") if cache_only else get_api_key("umls")
+    umls_ontologies_url = f"{UMLS_API_BASE_URL}metadata/current/sources?apiKey={umls_api_key}"
+
+    ols_data = collect_ols_data()
+    umls_data = collect_umls_data(umls_ontologies_url)
 
-print(f"Formatted data saved to formatted_ontology_data_{export_date}.csv")
+    return analyze_ontology_data(ols_data, umls_data, output_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the ontologies found in the external apis.")
+    parser.add_argument(
+        "--cache-only",
+        action="store_true",
+        help="Use only cached API responses. No requests are made to OLS or UMLS.",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=HTTP_CACHE_TTL,
+        help="Seconds a cached API response is used before it is revalidated.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always download the API responses, without reading or writing the cache.",
+    )
+    parser.add_argument("-o", "--output_dir", default=OUTPUT_PATH, help="Directory for the csvs")
+
+    args = parser.parse_args()
+
+    main(
+        cache_only=args.cache_only,
+        cache_ttl=args.cache_ttl,
+        use_cache=not args.no_cache,
+        output_dir=args.output_dir,
+    )
@@ -1,47 +1,86 @@
 #!/usr/bin/env python3
 '''
-Scans through all of the mappings in a db and returns distinct systems.
+Scans through all of the mappings in a db and returns distinct systems, with the
+number of codes using each.
 '''
 
 import argparse
-from google.cloud import firestore
 import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from locutus_util.common import LOGS_PATH
+from locutus_util import LOGS_PATH, SCAN_PARTITIONS, SCAN_MAX_WORKERS
+from locutus_util.snapshot import open_database
 from locutus_util.helpers import (set_logging_config, write_file)
 from locutus.model.ontologies_search import OntologyAPISearchModel
 
 
-def get_all_systems(db, all_sys_path):
+def scan_partition(query):
     """
-    Scans the 'mappings' subcollection of all documents in 'Terminology',
-    and returns a list of codes that are missing the 'system' field or have it null/empty.
+    Count the systems of the codes in one partition of the mappings collection group.
+
+    Returns:
+        tuple: (Counter of system > codes, mapping documents read)
+    """
+    system_counts = Counter()
+    documents_read = 0
+
+    for mapping_doc in query.stream():
+        documents_read += 1
+        # The collection group includes 'mappings' under any collection
+        if not mapping_doc.reference.path.startswith("Terminology/"):
+            continue
+        data = mapping_doc.to_dict() or {}
+        for code_entry in data.get("codes") or []:
+            system_counts[code_entry.get("system")] += 1
+
+    return system_counts, documents_read
+
+
+def get_all_systems(db, all_sys_path, partition_count=SCAN_PARTITIONS, max_workers=SCAN_MAX_WORKERS):
     """
-    existing_systems = set()
-
-    term_docs = db.collection("Terminology").list_documents()
-    total_missing = 0
-
-    for term_doc in term_docs:
-        term_id = term_doc.id
-        mappings_ref = term_doc.collection("mappings")
-        # if total_missing >= 10:
-        #     continue
-        for mapping_doc in mappings_ref.stream():
-            data = mapping_doc.to_dict()
-            codes = data.get("codes", [])
-            for code_entry in codes:
-                system = code_entry.get("system")
-                existing_systems.add(system)
-
-    # Convert the set to a list of dicts
-    system_data = [{"system": value if value is not None else "UNKNOWN"} for value in sorted(s for s in existing_systems if s is not None)]
+    Scans the 'mappings' subcollection of all documents in 'Terminology', and writes
+    each distinct code system with the number of codes that use it.
+
+    The 'mappings' collection group is split into partitions that are scanned in
+    parallel. Only the 'codes' field of each document is read.
+
+    Returns:
+        Counter: system > number of codes. None counts the codes without a system.
+    """
+    mappings = db.collection_group("mappings")
+    queries = [
+        partition.query().select(["codes"])
+        for partition in mappings.get_partitions(partition_count)
+    ]
+    logging.info(f"Scanning the mappings collection group in {len(queries)} partitions")
+
+    system_counts = Counter()
+    documents_read = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for partition_counts, partition_read in executor.map(scan_partition, queries):
+            system_counts.update(partition_counts)
+            documents_read += partition_read
+
+    logging.info(
+        f"Read {documents_read} mapping documents. Found {len(system_counts)} distinct systems, "
+        f"and {system_counts.get(None, 0)} codes without a system."
+    )
+
+    # Convert the counts to a list of dicts
+    system_data = [
+        {"system": system, "count": count}
+        for system, count in system_counts.items()
+        if system is not None
+    ]
 
     # Then call your write_file function
     write_file(all_sys_path, system_data, sort_by_list=["system"])
 
+    return system_counts
 
-def main(project_id,database):
+
+def main(project_id, database, partition_count=SCAN_PARTITIONS, max_workers=SCAN_MAX_WORKERS, snapshot=None):
 
     _log_file = f"{LOGS_PATH}/{datetime.now().strftime('%Y%m%d_%H%M%S')}_{project_id}_{database}_system_remediation.log"
     all_sys_path = f"{LOGS_PATH}/{datetime.now().strftime('%Y%m%d_%H%M%S')}_{project_id}_{database}_existing_systems.csv"
@@ -50,20 +89,25 @@ def main(project_id,database):
     # Set logging configs -log file created in data/logs
     set_logging_config(log_file = _log_file)
 
-    # Initiate Firestore client and setting the project_id
-    db = firestore.Client(project=project_id, database=database)
+    # Initiate Firestore client and setting the project_id, or read a local export
+    db = open_database(project_id, database, snapshot)
     
-    empty_systems = get_all_systems(db, all_sys_path)
+    return get_all_systems(db, all_sys_path, partition_count, max_workers)
 
 
 if __name__ == "__main__":
     
     parser = argparse.ArgumentParser(description="Delete Terminology documents with slashes in their index.")
-    parser.add_argument('-p', '--project_id', required=True, help="GCP Project to edit")
+    parser.add_argument('-p', '--project_id', required=False, help="GCP Project to edit")
     parser.add_argument('-db', '--database', required=False, help="Database to edit. Will edit the projects default db if not set here.")
+    parser.add_argument('-s', '--snapshot', required=False, help="Scan a firestore_to_json export instead of the database. Nothing is written.")
+    parser.add_argument('--partitions', type=int, default=SCAN_PARTITIONS, help="Partitions the mappings scan is split into")
+    parser.add_argument('-w', '--workers', type=int, default=SCAN_MAX_WORKERS, help="Partitions scanned at once")
 
 
     args = parser.parse_args()
-    
+    if not (args.project_id or args.snapshot):
+        parser.error("one of -p/--project_id or -s/--snapshot is required")
 
-    main(project_id=args.project_id,database=args.database)
+    main(project_id=args.project_id, database=args.database,
+         partition_count=args.partitions, max_workers=args.workers, snapshot=args.snapshot)
@@ -2,15 +2,21 @@
 import argparse
 from datetime import datetime
 from google.cloud import firestore
-from locutus_util.common import LOGS_PATH
+from locutus_util import LOGS_PATH, COL_TIME_LIMIT
 from locutus_util.helpers import (update_gcloud_project, drop_collection_data,
-                                  set_logging_config)
+                                  set_logging_config, logger, collection_inventory,
+                                  log_inventory)
 
 
-def delete_project_data(project_id):
+def delete_project_data(project_id, time_limit=COL_TIME_LIMIT, inventory_only=False):
     """Delete specified collections and documents(seed data) from the specified
     Firestore project.
     Collections and docuements specified will have all sub-files dropped.
+    The whole run stops after `time_limit` seconds.
+
+    Document counts per collection are printed before and after the deletion.
+    Counts use aggregation queries, so no documents are pulled. Set
+    `inventory_only` to print the counts without deleting anything.
     """
     _log_file = f"{LOGS_PATH}/{datetime.now().strftime('%Y%m%d_%H%M%S')}_{project_id}_delete_project_data.log"
 
@@ -23,14 +29,30 @@ def delete_project_data(project_id):
     # Firestore client after setting the project_id
     db = firestore.Client()
 
+    before = collection_inventory(db)
+    log_inventory(before, "Inventory before deletion")
+
+    if inventory_only:
+        return
+
     # Loops through Collections. Deletes Collections/Documents/SubCollections/Documents
-    drop_collection_data(db)
+    deleted = drop_collection_data(db, time_limit=time_limit)
+    logger.info(f"Deleted {sum(deleted.values())} documents in total.")
+
+    # Recount the same collections, including subcollections that may now be hidden
+    after = collection_inventory(db, paths=list(before))
+    log_inventory(after, "Inventory after deletion")
 
 if __name__ == '__main__':
     
     parser = argparse.ArgumentParser(description="Delete Firestore collections and their contents.")
     parser.add_argument('-p', '--project_id', required=True, help="GCP Project to edit")
+    parser.add_argument('-t', '--time_limit', type=int, default=COL_TIME_LIMIT,
+                        help=f"Seconds the whole deletion may run before stopping. Default {COL_TIME_LIMIT}")
+    parser.add_argument('-i', '--inventory_only', action='store_true',
+                        help="Print document counts per collection without deleting anything.")
 
     args = parser.parse_args()
 
-    delete_project_data(project_id=args.project_id)
\ No newline at end of file
+    delete_project_data(project_id=args.project_id, time_limit=args.time_limit,
+                        inventory_only=args.inventory_only)
\ No newline at end of file
@@ -1,29 +1,68 @@
-import yaml
-import requests
 import os
 import json
+import logging
 import re
 import sys
 import time
-import pandas as pd
+import threading
+from collections import Counter
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from google.cloud import firestore
-from locutus_util import (logger,update_gcloud_project,COL_TIME_LIMIT,SUB_TIME_LIMIT,BATCH_SIZE,LOCUTUS_SYSTEM_MAP_PATH)
+from locutus_util import (logger,update_gcloud_project,COL_TIME_LIMIT,LOCUTUS_SYSTEM_MAP_PATH,
+                          DELETE_PAGE_SIZE,DELETE_MAX_WORKERS,DELETE_MAX_ATTEMPTS,INVENTORY_PROBE_LIMIT,
+                          HTTP_MAX_WORKERS)
 
-# Initialize Firestore client
-db = firestore.Client()
+# pandas, yaml and the http client are imported inside the functions that use them, so
+# importing this module stays cheap for CLIs that only need a few helpers.
 
-def drop_collection_data(db):
-    """Loop through all collections in Firestore and delete them."""
+def set_logging_config(log_file):
+    """
+    Write the log records to `log_file` instead of the default dated log in data/logs.
+    The file is only created when the first record is written.
+    """
+    from locutus_util import DelayedFileHandler
+
+    for handler in list(logger.handlers):
+        if isinstance(handler, logging.FileHandler):
+            logger.removeHandler(handler)
+            handler.close()
+
+    file_handler = DelayedFileHandler(log_file)
+    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logger.addHandler(file_handler)
+
+def drop_collection_data(db, time_limit=COL_TIME_LIMIT):
+    """
+    Loop through all collections in Firestore and delete them.
+
+    Every collection shares a single deadline of `time_limit` seconds.
+
+    Returns:
+        dict: Number of documents deleted, keyed by collection path.
+    """
     # Get all top-level collections
-    collections = db.collections()
-    has_collections = False
+    collections = list(db.collections())
+
+    if not collections:
+        logger.info("No collections found. Firestore database is already empty.")
+        return {}
+
+    with RecursiveDeleter(db, time_limit=time_limit) as deleter:
+        for collection in collections:
+            logger.info(f"Deleting collection '{collection.id}'...")
+            deleter.delete_collection(collection)
+
+            if deleter.timed_out:
+                logger.warning(f"Timeout reached while deleting collection '{collection.id}'. Stopping.")
+                break
+
+    for collection_path, count in sorted(deleter.deleted.items()):
+        logger.info(f"Deleted {count} documents from '{collection_path}'.")
+    for collection_path, count in sorted(deleter.failed.items()):
+        logger.error(f"Failed to delete {count} documents from '{collection_path}'.")
 
     for collection in collections:
-        has_collections = True
-        logger.info(f"Deleting collection '{collection.id}'...")
-        delete_collection(collection)
-        
         # After attempting to delete, verify if the collection is empty
         if is_collection_empty(db, collection):
             logger.info(f"Collection '{collection.id}' successfully deleted.")
@@ -31,88 +70,189 @@ def drop_collection_data(db):
             logger.warning(f"Collection '{collection.id}' and its subcollections are not completely deleted.")
             sys.exit(1)
 
-    if not has_collections:
-        logger.info("No collections found. Firestore database is already empty.")
+    return dict(deleter.deleted)
 
 def is_collection_empty(db, coll_ref):
-    """Check if a collection and its subcollections are empty."""
+    """
+    Check if a collection and its subcollections are empty.
+
+    Uses a count() aggregation, so no documents are read. A single id probe catches
+    missing documents that still hold subcollections, which list_documents reports
+    but queries do not.
+    """
     # Check for any remaining documents in the collection
-    docs = list(coll_ref.limit(1).stream())
-    if len(docs) > 0:
+    if count_documents(coll_ref) > 0:
         return False
 
-    # Check for any subcollections within the documents of this collection
-    for doc in coll_ref.list_documents():
-        for subcollection in doc.collections():
-            subcoll_ref = db.collection(f"{coll_ref.id}/{doc.id}/{subcollection.id}")
-            if not is_collection_empty(subcoll_ref):
-                return False
+    # Check for any documents that only exist as the parent of a subcollection
+    return next(iter(coll_ref.list_documents(page_size=1)), None) is None
+
+def count_documents(query):
+    """Count the documents matched by a collection or query with a count() aggregation."""
+    result = query.count(alias="total").get()
+    return int(result[0][0].value)
 
-    return True
+def probe_subcollection_ids(coll_ref, probe_limit=INVENTORY_PROBE_LIMIT):
+    """Names of the subcollections found under the first `probe_limit` documents of a collection."""
+    subcollection_ids = set()
+    for doc_ref in islice(coll_ref.list_documents(page_size=probe_limit), probe_limit):
+        subcollection_ids.update(subcollection.id for subcollection in doc_ref.collections())
+    return sorted(subcollection_ids)
 
-def delete_collection(coll_ref, batch_size=BATCH_SIZE, time_limit=COL_TIME_LIMIT):
+def collection_inventory(db, paths=None, probe_limit=INVENTORY_PROBE_LIMIT):
     """
-    Delete all documents in a collection, handling batches and subcollections.
-    Includes a time limit to prevent infinite running.
+    Count the documents in each collection without pulling any documents.
 
     Args:
-        coll_ref (CollectionReference): The Firestore collection reference.
-        batch_size (int): The number of documents to delete per batch.
-        time_limit (int): Maximum time in seconds to spend on deletion before stopping.
-    """
-    start_time = time.time()
-    while True:
-        # Checks the time limit has not expired
-        if time.time() - start_time > time_limit:
-            logger.warning(f"Timeout reached while deleting collection '{coll_ref.id}'. Stopping.")
-            break
-        
-        # Gets document_ids from the collection reference
-        docs = coll_ref.list_documents(page_size=batch_size)
-
-        deleted = 0
-
-        # Recursively delete any subcollections of the document
-        for doc in docs:
-            try:
-                delete_subcollections(doc)  
-                logger.info(f"Deleting document {doc.id} from collection '{coll_ref.id}'.")
-                doc.delete()
-                deleted += 1
-            except Exception as e:
-                logger.error(f"Failed to delete document {doc.id}: {e}")
-
-        if deleted == 0:
-            logger.info(f"No more documents to delete in collection '{coll_ref.id}'.")
-            break
-
-        logger.info(f"Deleted {deleted} documents from collection '{coll_ref.id}'.")
-
-        # Continue if the number of deleted documents reached the batch size, otherwise stop
-        if deleted < batch_size:
-            break
-
-def delete_subcollections(doc_ref, batch_size=BATCH_SIZE, time_limit=SUB_TIME_LIMIT):
-    """
-    Delete all subcollections of a given document, with a time limit to prevent infinite run
-    
-    Args:
-        doc_ref (DocumentReference): The Firestore document reference.
-        batch_size (int): The number of documents to delete per batch.
-        time_limit (int): Maximum time in seconds to spend on deleting subcollections.
+        db (Client): The Firestore client.
+        paths (list): Collection paths to count. Top-level collections by id, and
+            subcollections as '{collection}/*/{subcollection}'. Subcollections are
+            counted as a collection group, across all parents sharing the name.
+            When None, every top-level collection is counted, along with the
+            subcollections found by probing `probe_limit` of its documents.
+        probe_limit (int): Documents per collection checked for subcollection names.
+
+    Returns:
+        dict: Document counts keyed by collection path.
     """
-    start_time = time.time()
-    for subcollection in doc_ref.collections():
-        if time.time() - start_time > time_limit:
-            logger.warning(f"Timeout reached while deleting subcollections for document '{doc_ref.id}'. Stopping.")
-            break
+    if paths is None:
+        paths = []
+        for collection in db.collections():
+            paths.append(collection.id)
+            paths.extend(
+                f"{collection.id}/*/{subcollection_id}"
+                for subcollection_id in probe_subcollection_ids(collection, probe_limit)
+            )
+
+    inventory = {}
+    for path in paths:
+        if "/" in path:
+            query = db.collection_group(path.split("/")[-1])
+        else:
+            query = db.collection(path)
+        inventory[path] = count_documents(query)
 
-        logger.info(f"Deleting subcollection '{subcollection.id}' for document '{doc_ref.id}'.")
-        delete_collection(subcollection, batch_size=batch_size, time_limit=time_limit)
+    return inventory
+
+def log_inventory(inventory, title):
+    logger.info(f"{title}: {sum(inventory.values())} documents")
+    for path, count in inventory.items():
+        logger.info(f"    {path}: {count}")
+
+def collection_path_pattern(doc_ref):
+    """
+    Collection path of a document with the parent document ids wildcarded.
+    Example: Terminology/tm--123/mappings/code1 > Terminology/*/mappings
+    """
+    parts = doc_ref.path.split("/")[:-1]
+    return "/".join("*" if i % 2 else part for i, part in enumerate(parts))
+
+class RecursiveDeleter:
+    """
+    Deletes collections, their documents and every nested subcollection.
+
+    Deletes are queued on one BulkWriter, which batches and parallelizes the
+    writes. Document ids and subcollections are listed a level at a time by a
+    pool of worker threads. All work stops once the shared deadline passes.
+    """
+
+    def __init__(self, db, time_limit=COL_TIME_LIMIT, page_size=DELETE_PAGE_SIZE,
+                 max_workers=DELETE_MAX_WORKERS):
+        """
+        Args:
+            db (Client): The Firestore client.
+            time_limit (int): Seconds the whole run may take before it stops.
+            page_size (int): The number of document ids listed per request.
+            max_workers (int): Threads used to list documents and subcollections.
+        """
+        self.page_size = page_size
+        self.deadline = time.monotonic() + time_limit
+        self.timed_out = False
+        self.deleted = Counter()
+        self.failed = Counter()
+
+        self._write_lock = threading.Lock()
+        self._count_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._bulk_writer = db.bulk_writer()
+        self._bulk_writer.on_write_result(self._on_write_result)
+        self._bulk_writer.on_write_error(self._on_write_error)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Wait for queued deletes to finish and release the worker threads."""
+        self._bulk_writer.close()
+        self._executor.shutdown(wait=True)
+
+    def expired(self):
+        if not self.timed_out and time.monotonic() > self.deadline:
+            self.timed_out = True
+        return self.timed_out
+
+    def delete_collection(self, coll_ref):
+        """
+        Delete all documents in a collection, including subcollections at any depth.
+
+        Args:
+            coll_ref (CollectionReference): The Firestore collection reference.
+        """
+        collections = [coll_ref]
+
+        while collections and not self.expired():
+            documents = [
+                doc
+                for docs in self._executor.map(self._delete_documents, collections)
+                for doc in docs
+            ]
+            collections = [
+                subcollection
+                for subcollections in self._executor.map(self._list_subcollections, documents)
+                for subcollection in subcollections
+            ]
+
+        self._bulk_writer.flush()
+
+    def _delete_documents(self, coll_ref):
+        """Queue a delete for every document id in the collection. Returns the references."""
+        documents = []
+        # list_documents also returns missing documents that only hold subcollections
+        for doc_ref in coll_ref.list_documents(page_size=self.page_size):
+            if self.expired():
+                break
+            documents.append(doc_ref)
+            with self._write_lock:
+                self._bulk_writer.delete(doc_ref)
+        return documents
+
+    def _list_subcollections(self, doc_ref):
+        if self.expired():
+            return []
+        return list(doc_ref.collections())
+
+    def _on_write_result(self, reference, result, bulk_writer):
+        with self._count_lock:
+            self.deleted[collection_path_pattern(reference)] += 1
+
+    def _on_write_error(self, error, bulk_writer):
+        reference = error.operation.reference
+        if error.attempts < DELETE_MAX_ATTEMPTS and not self.expired():
+            return True
+
+        logger.error(f"Failed to delete document {reference.path}: {error.message}")
+        with self._count_lock:
+            self.failed[collection_path_pattern(reference)] += 1
+        return False
 
 
 def read_file(filepath,delimeter=None):
-    
+    import pandas as pd
+    import yaml
+
     file_ext = os.path.splitext(filepath)[-1].lower()
 
     if not delimeter and file_ext == 'csv':
@@ -140,6 +280,8 @@ def read_file(filepath,delimeter=None):
 
 def write_file(filepath, data, sort_by_list=[]):
     """Creates a directory for the table and writes a YAML, SQL, BASH, or Markdown file based on the extension."""
+    import pandas as pd
+
     filepath = Path(filepath)
     file_extension = filepath.suffix
 
@@ -160,68 +302,111 @@ def write_file(filepath, data, sort_by_list=[]):
     logger.info(f"Generated: {Path(filepath).name}")
 
 def load_ontology_lookup():
-    df = pd.read_csv(LOCUTUS_SYSTEM_MAP_PATH)
-    return dict(zip(df["curie"], df["system"]))
+    """
+    curie > system lookup from locutus_system_map.csv. The file is only re-read
+    when it changes. The dict is shared, do not modify it.
+    """
+    from locutus_util.reference_data import get_system_map
+
+    return get_system_map()
 
-def parse_owl2_data(source_data):
+def parse_owl2_data(source_data, entity_types=("ObjectProperty",)):
     """
     Parses 'OWL 2 Functional Syntax' files read-in as text(function read_file)
+    Descriptions and labels are joined to each entity by IRI.
+    To stream a file without reading it all, use seed_etl.owl_parser.OWLFunctionalParser.
     Use case: https://raw.githubusercontent.com/ga4gh/pedigree_family_history_terminology/refs/heads/main/src/main/resources/kin.owl
     """
-    property_pattern = r"Object Property: <(.*?)> \((.*?)\)"
-    description_pattern = r"AnnotationAssertion\(<http://www.w3.org/2004/02/skos/core#definition> <.*?> \"(.*?)\""
+    import pandas as pd
+    from locutus_util.seed_etl.owl_parser import OWLFunctionalParser
 
-    # Extract object property definitions
-    properties = re.findall(property_pattern, source_data)
-    descriptions = re.findall(description_pattern, source_data)
-
-    data = pd.DataFrame(
-        {
-            "code": [code.split("#")[-1] for code, _ in properties],  # Extract only the code (e.g., KIN_001)
-            "display": [display for _, display in properties],  # Extract the display names
-            "description": [descriptions[i] if i < len(descriptions) else "" for i in range(len(properties))]
-        }
+    rows = OWLFunctionalParser(source_data.splitlines(), entity_types=entity_types)
+    return pd.DataFrame(
+        rows,
+        columns=["code", "display", "description", "label", "entity_type", "iri"],
     )
 
-    return data
+def save_terminology(base_url, terminology, max_workers=HTTP_MAX_WORKERS):
+    """
+    PUT each Terminology to locutus, with up to `max_workers` requests in flight.
 
-def save_terminology(base_url, terminology):
-    response = {}
-    for keys, values in terminology.items():
+    Returns:
+        dict: {"status_code", "response"} keyed like `terminology`.
+    """
+    from locutus_util.http_client import (timed_request, run_concurrently,
+                                          log_latency_summary)
+
+    headers = {"Content-Type": "application/json"}
+
+    def put(item):
+        keys, values = item
         t_id = values.get('id')
         endpoint = f"{base_url}/api/Terminology/{t_id}"
-        headers = {"Content-Type": "application/json"}
         try:
-            res = requests.put(endpoint, json=values, headers=headers)
-            response[keys] = {"status_code": res.status_code, "response": res.text}
+            res, elapsed = timed_request("PUT", endpoint, json=values, headers=headers)
             if res.status_code != 200:
                 logger.error(
                     f"Failed to save terminology {endpoint}: {res.status_code} - {res.text}"
                 )
             if res.status_code == 200:
-                logger.info(f"{res.status_code} - '{endpoint}'")
+                logger.info(f"{res.status_code} - '{endpoint}' ({elapsed * 1000:.0f} ms)")
+            return keys, {"status_code": res.status_code, "response": res.text}, elapsed
 
         except Exception as e:
             logger.error(f"Error while saving terminology {keys}: {e}")
+            return keys, None, None
+
+    response = {}
+    latencies = []
+    for keys, result, elapsed in run_concurrently(put, terminology.items(), max_workers):
+        if result is not None:
+            response[keys] = result
+            latencies.append(elapsed)
+
+    log_latency_summary("save_terminology", latencies)
     return response
 
-def delete_codes(base_url, terminology):
+def delete_codes(base_url, terminology, max_workers=HTTP_MAX_WORKERS):
+    """
+    DELETE each code of each Terminology from locutus, with up to `max_workers`
+    requests in flight.
+
+    Returns:
+        dict: {"status_code", "response"} of the last code deleted, keyed like `terminology`.
+    """
+    from locutus_util.http_client import (timed_request, run_concurrently,
+                                          log_latency_summary)
+
+    headers = {"Content-Type": "application/json"}
+    body = {"editor":"locutus_utils"}
+
+    def delete(item):
+        keys, t_id, code = item
+        endpoint = f"{base_url}/api/Terminology/{t_id}/code/{code}"
+        try:
+            res, elapsed = timed_request("DELETE", endpoint, json=body, headers=headers)
+            if res.status_code != 200:
+                logger.error(f"Failed to delete codes {keys}: {res.status_code} - {res.text}")
+            if res.status_code == 200:
+                logger.info(f"{res.status_code} - '{endpoint}' ({elapsed * 1000:.0f} ms)")
+            return keys, {"status_code": res.status_code, "response": res.text}, elapsed
+        except Exception as e:
+            logger.error(f"Error while deleting codes {keys}: {e}")
+            return keys, None, None
+
+    items = [
+        (keys, values.get('id'), i.get('code'))
+        for keys, values in terminology.items()
+        for i in values.get('codes')
+    ]
+
     response = {}
-    for keys, values in terminology.items():
-        t_id = values.get('id')
-        codes = values.get('codes')
-        for i in codes:
-            code = i.get('code')
-            endpoint = f"{base_url}/api/Terminology/{t_id}/code/{code}"
-            headers = {"Content-Type": "application/json"}
-            body = {"editor":"locutus_utils"}
-            try:
-                res = requests.delete(endpoint, json=body, headers=headers)
-                response[keys] = {"status_code": res.status_code, "response": res.text}
-                if res.status_code != 200:
-                    logger.error(f"Failed to delete codes {keys}: {res.status_code} - {res.text}")
-                if res.status_code == 200:
-                    logger.info(f"{res.status_code} - '{endpoint}'")
-            except Exception as e:
-                logger.error(f"Error while deleting codes {keys}: {e}")
+    latencies = []
+    # Results come back in request order, so the last code of each Terminology is kept
+    for keys, result, elapsed in run_concurrently(delete, items, max_workers):
+        if result is not None:
+            response[keys] = result
+            latencies.append(elapsed)
+
+    log_latency_summary("delete_codes", latencies)
     return response
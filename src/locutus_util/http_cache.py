@@ -0,0 +1,182 @@
+"""
+Disk-backed cache for GET requests to the ontology APIs.
+
+Responses are kept in a SQLite database in data/cache, keyed by url with api keys
+redacted. A cached response is used as is until it is older than the TTL. After
+that it is revalidated with `If-None-Match`/`If-Modified-Since`, and a 304 reply
+refreshes it without downloading the body again.
+
+In cache-only mode no requests are made, and cached responses are returned
+regardless of age. Useful offline, or for repeated analysis runs.
+
+Usage:
+    from locutus_util.http_cache import configure_http_cache, cached_get_json
+    configure_http_cache(ttl=3600, cache_only=False)
+    data = cached_get_json(url)
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from locutus_util import logger, HTTP_CACHE_PATH, HTTP_CACHE_TTL
+from locutus_util.http_client import timed_request, redact_url
+
+
+class CacheMissError(LookupError):
+    """Raised in cache-only mode when a url has no cached response."""
+
+
+class ResponseCache:
+    """
+    SQLite store of response bodies and their validators, keyed by redacted url.
+
+    Args:
+        path (Path): The SQLite database file.
+        ttl (int): Seconds a response is used before it is revalidated.
+        cache_only (bool): Never make a request. Serve cached responses at any age.
+    """
+
+    def __init__(self, path=HTTP_CACHE_PATH, ttl=HTTP_CACHE_TTL, cache_only=False):
+        self.path = path
+        self.ttl = ttl
+        self.cache_only = cache_only
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL
+            )"""
+        )
+        self._connection.commit()
+
+    def get(self, url):
+        """
+        Returns:
+            dict: body, etag, last_modified, fetched_at. None if not cached.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM responses WHERE url = ?",
+                (redact_url(url),),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(["body", "etag", "last_modified", "fetched_at"], row))
+
+    def put(self, url, body, etag=None, last_modified=None):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (redact_url(url), body, etag, last_modified, time.time()),
+            )
+            self._connection.commit()
+
+    def touch(self, url):
+        """Mark a cached response as fresh, after the server confirmed it is unchanged."""
+        with self._lock:
+            self._connection.execute(
+                "UPDATE responses SET fetched_at = ? WHERE url = ?",
+                (time.time(), redact_url(url)),
+            )
+            self._connection.commit()
+
+    def is_fresh(self, entry):
+        return self.cache_only or time.time() - entry["fetched_at"] < self.ttl
+
+    def log_stats(self):
+        logger.info(
+            f"HTTP cache: {self.hits} hits, {self.revalidated} revalidated, {self.misses} downloaded"
+        )
+
+
+_response_cache = None
+_cache_enabled = True
+_configure_lock = threading.Lock()
+
+
+def configure_http_cache(enabled=True, ttl=HTTP_CACHE_TTL, cache_only=False, path=HTTP_CACHE_PATH):
+    """Set how cached_get_json uses the cache for the rest of the process."""
+    global _response_cache, _cache_enabled
+    with _configure_lock:
+        _cache_enabled = enabled
+        _response_cache = ResponseCache(path, ttl, cache_only) if enabled else None
+
+
+def get_response_cache():
+    """Return the configured cache, creating the default one on first use. None if disabled."""
+    global _response_cache
+    if _response_cache is None and _cache_enabled:
+        with _configure_lock:
+            if _response_cache is None and _cache_enabled:
+                _response_cache = ResponseCache()
+    return _response_cache
+
+
+def cached_get_json(url):
+    """
+    GET a url and return its JSON body, using the response cache.
+
+    Returns:
+        The decoded JSON, or None if the request did not return 200.
+
+    Raises:
+        CacheMissError: In cache-only mode, when the url was never cached.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        response, elapsed = timed_request("GET", url)
+        logger.info(f"{redact_url(url)} ({elapsed * 1000:.0f} ms)")
+        return response.json() if response.status_code == 200 else None
+
+    entry = cache.get(url)
+    if entry is not None and cache.is_fresh(entry):
+        cache.hits += 1
+        logger.debug(f"{redact_url(url)} (cached)")
+        return json.loads(entry["body"])
+
+    if cache.cache_only:
+        raise CacheMissError(f"No cached response for {redact_url(url)}")
+
+    headers = {}
+    if entry is not None:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    try:
+        response, elapsed = timed_request("GET", url, headers=headers)
+    except Exception as e:
+        if entry is None:
+            raise
+        logger.warning(f"Request failed, using the stale cached response for {redact_url(url)}: {e}")
+        return json.loads(entry["body"])
+
+    logger.info(f"{redact_url(url)} - {response.status_code} ({elapsed * 1000:.0f} ms)")
+
+    if response.status_code == 304 and entry is not None:
+        cache.revalidated += 1
+        cache.touch(url)
+        return json.loads(entry["body"])
+
+    if response.status_code != 200:
+        return None
+
+    cache.misses += 1
+    cache.put(
+        url,
+        response.text,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+    )
+    return response.json()
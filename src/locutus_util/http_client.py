@@ -0,0 +1,134 @@
+"""
+Shared HTTP client for requests to Locutus and the external ontology APIs.
+
+All requests go through one requests.Session, so TCP/TLS connections are pooled
+and kept alive between calls. Requests can be sent concurrently with
+`run_concurrently`, and every request is timed.
+"""
+
+import re
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from locutus_util import logger, HTTP_MAX_WORKERS, HTTP_TIMEOUT
+
+SECRET_PARAMS = re.compile(r"([?&](?:apiKey|apikey|api_key|key|ticket)=)[^&#]*")
+
+_session = None
+_pool_size = 0
+_session_lock = threading.Lock()
+
+
+def redact_url(url):
+    """Replace the values of api key parameters, so urls are safe to store and log."""
+    return SECRET_PARAMS.sub(r"\1REDACTED", url)
+
+
+def _mount_adapter(session, pool_size):
+    from locutus_util.http_replay import replay_adapter
+
+    # Record/replay adapter when LOCUTUS_HTTP_MODE is set(see http_replay)
+    adapter = replay_adapter(pool_size) or HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+def get_session(pool_size=HTTP_MAX_WORKERS):
+    """
+    Return the shared Session, creating it on first use.
+
+    Args:
+        pool_size (int): Connections kept alive per host. Should be at least the
+            number of concurrent workers, or connections will be discarded. If it
+            is larger than the current pool, a larger pool is mounted.
+    """
+    global _session, _pool_size
+    if _session is None or pool_size > _pool_size:
+        with _session_lock:
+            if _session is None:
+                _session = requests.Session()
+            if pool_size > _pool_size:
+                # The old adapter is not closed, requests in flight on other threads finish on it
+                _mount_adapter(_session, pool_size)
+                _pool_size = pool_size
+
+    return _session
+
+
+def reset_session():
+    """Close the shared Session. The next request creates a new one."""
+    global _session, _pool_size
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _pool_size = 0
+
+
+def timed_request(method, url, timeout=HTTP_TIMEOUT, **kwargs):
+    """
+    Send a request with the shared Session.
+
+    Returns:
+        tuple: (Response, elapsed seconds)
+    """
+    start = time.perf_counter()
+    response = get_session().request(method, url, timeout=timeout, **kwargs)
+    return response, time.perf_counter() - start
+
+
+def run_concurrently(func, items, max_workers=HTTP_MAX_WORKERS):
+    """
+    Call `func` on every item with up to `max_workers` calls in flight.
+
+    Returns:
+        list: The results, in the same order as `items`.
+    """
+    items = list(items)
+    # Keep a pooled connection for every worker
+    get_session(pool_size=max_workers)
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, items))
+
+
+def summarize_latencies(latencies):
+    """
+    Summarize request latencies given in seconds.
+
+    Returns:
+        dict: count, and p50/p90/p99/max in milliseconds.
+    """
+    latencies = sorted(latency * 1000 for latency in latencies)
+    if not latencies:
+        return {"count": 0}
+    if len(latencies) == 1:
+        percentiles = latencies * 99
+    else:
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+
+    return {
+        "count": len(latencies),
+        "p50": percentiles[49],
+        "p90": percentiles[89],
+        "p99": percentiles[98],
+        "max": latencies[-1],
+    }
+
+
+def log_latency_summary(title, latencies):
+    summary = summarize_latencies(latencies)
+    if not summary["count"]:
+        return
+    logger.info(
+        f"{title}: {summary['count']} requests. "
+        f"p50 {summary['p50']:.0f} ms, p90 {summary['p90']:.0f} ms, "
+        f"p99 {summary['p99']:.0f} ms, max {summary['max']:.0f} ms"
+    )
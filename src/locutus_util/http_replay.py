@@ -0,0 +1,211 @@
+"""
+Record and replay external API calls, so the ETL can be run and timed offline.
+
+Set with environment variables, so any script can be run in either mode:
+    LOCUTUS_HTTP_MODE      'record', 'replay' or unset(normal requests)
+    LOCUTUS_FIXTURES_DIR   Where fixtures are written and read. Defaults to data/fixtures.
+    LOCUTUS_REPLAY_LATENCY Seconds to wait before a replayed response is returned.
+                           'recorded'(default) waits as long as the recorded call took.
+
+Requests sent with the shared Session in http_client are recorded by the Session's
+adapter. Libraries that send their own requests(ex. search-dragon) can be wrapped
+at the function level with `replayable`.
+
+Each call is stored as one JSON file named by a hash of the request, with api keys
+redacted. A replay run can therefore use a different key, or none.
+
+Run examples
+`LOCUTUS_HTTP_MODE=record python src/locutus_util/analysis/analyze_ontology_data.py`
+`LOCUTUS_HTTP_MODE=replay LOCUTUS_REPLAY_LATENCY=0 python src/locutus_util/analysis/analyze_ontology_data.py`
+Responses served from the http_cache are not requested, so they are not recorded.
+"""
+
+import base64
+import functools
+import hashlib
+import json
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from locutus_util import logger, FIXTURES_PATH
+from locutus_util.http_client import redact_url, reset_session
+
+RECORD = "record"
+REPLAY = "replay"
+HTTP_NAMESPACE = "http"
+
+# The recorded body is already decoded, so these no longer describe it.
+DROPPED_HEADERS = {"content-encoding", "transfer-encoding", "content-length", "connection"}
+
+_settings = None
+
+
+class ReplayMissError(requests.ConnectionError):
+    """Raised in replay mode when a call was never recorded."""
+
+
+def configure_replay(mode=None, fixtures_dir=None, latency=None):
+    """
+    Override the environment variables for the rest of the process.
+
+    Args:
+        mode (str): 'record', 'replay' or None.
+        fixtures_dir (Path): Fixture directory.
+        latency (float or 'recorded'): Delay for replayed calls.
+    """
+    global _settings
+    _settings = {
+        "mode": mode,
+        "fixtures_dir": Path(fixtures_dir or FIXTURES_PATH),
+        "latency": "recorded" if latency is None else latency,
+    }
+    # The Session's adapter is chosen when the Session is created
+    reset_session()
+
+
+def get_settings():
+    global _settings
+    if _settings is None:
+        latency = os.getenv("LOCUTUS_REPLAY_LATENCY", "recorded")
+        _settings = {
+            "mode": os.getenv("LOCUTUS_HTTP_MODE") or None,
+            "fixtures_dir": Path(os.getenv("LOCUTUS_FIXTURES_DIR") or FIXTURES_PATH),
+            "latency": latency if latency == "recorded" else float(latency),
+        }
+        if _settings["mode"] not in (None, RECORD, REPLAY):
+            raise ValueError(f"LOCUTUS_HTTP_MODE must be '{RECORD}' or '{REPLAY}'")
+    return _settings
+
+
+def fixture_path(namespace, *parts):
+    """The fixture file for a call, named by a hash of its redacted parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return get_settings()["fixtures_dir"] / namespace / f"{digest.hexdigest()[:32]}.json"
+
+
+def write_fixture(path, fixture):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as fixture_file:
+        json.dump(fixture, fixture_file, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def read_fixture(path, description):
+    try:
+        with open(path, "r") as fixture_file:
+            fixture = json.load(fixture_file)
+    except FileNotFoundError:
+        raise ReplayMissError(f"No recorded response for {description} ({path})")
+
+    latency = get_settings()["latency"]
+    delay = fixture.get("elapsed", 0) if latency == "recorded" else latency
+    if delay:
+        time.sleep(delay)
+    return fixture
+
+
+class RecordReplayAdapter(HTTPAdapter):
+    """Transport adapter that records responses to fixtures, or serves them from fixtures."""
+
+    def __init__(self, mode, **kwargs):
+        self.mode = mode
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        url = redact_url(request.url)
+        body = request.body or b""
+        path = fixture_path(HTTP_NAMESPACE, request.method, url, body)
+
+        if self.mode == REPLAY:
+            fixture = read_fixture(path, f"{request.method} {url}")
+            return self.build_replayed_response(request, fixture)
+
+        start = time.perf_counter()
+        response = super().send(request, **kwargs)
+        content = response.content
+        elapsed = time.perf_counter() - start
+
+        try:
+            body_field = {"text": content.decode("utf-8")}
+        except UnicodeDecodeError:
+            body_field = {"base64": base64.b64encode(content).decode("ascii")}
+
+        write_fixture(path, {
+            "request": {"method": request.method, "url": url},
+            "status_code": response.status_code,
+            "reason": response.reason,
+            "headers": {
+                key: value for key, value in response.headers.items()
+                if key.lower() not in DROPPED_HEADERS
+            },
+            "elapsed": elapsed,
+            **body_field,
+        })
+        return response
+
+    @staticmethod
+    def build_replayed_response(request, fixture):
+        response = requests.Response()
+        response.status_code = fixture["status_code"]
+        response.reason = fixture.get("reason")
+        response.headers = CaseInsensitiveDict(fixture.get("headers", {}))
+        if "base64" in fixture:
+            response._content = base64.b64decode(fixture["base64"])
+        else:
+            response._content = fixture.get("text", "").encode("utf-8")
+            response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=fixture.get("elapsed", 0))
+        return response
+
+
+def replay_adapter(pool_size):
+    """The adapter for the shared Session, or None when not recording or replaying."""
+    mode = get_settings()["mode"]
+    if mode is None:
+        return None
+    logger.info(f"HTTP {mode} mode. Fixtures: {get_settings()['fixtures_dir']}")
+    return RecordReplayAdapter(mode, pool_connections=pool_size, pool_maxsize=pool_size)
+
+
+def replayable(namespace, func):
+    """
+    Wrap a function that makes its own API calls, so its results are recorded or replayed.
+
+    The call is identified by its arguments. Results must be JSON serializable.
+
+    Args:
+        namespace (str): Fixture subdirectory, ex. 'search_dragon'.
+        func (callable): The function to wrap.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        mode = get_settings()["mode"]
+        if mode is None:
+            return func(*args, **kwargs)
+
+        call = json.dumps({"args": args, "kwargs": kwargs}, sort_keys=True, default=str)
+        path = fixture_path(namespace, call)
+
+        if mode == REPLAY:
+            return read_fixture(path, f"{namespace} {call}")["result"]
+
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        write_fixture(path, {
+            "call": json.loads(call),
+            "result": result,
+            "elapsed": time.perf_counter() - start,
+        })
+        return result
+
+    return wrapper
@@ -0,0 +1,131 @@
+"""
+Writes proposed systems back to Terminology mapping documents.
+
+Used by the backfill_missing_systems and normalize_systems remediations. Their
+review csvs have one entry per code. The entries are grouped by mapping document, so
+each document is read once(with get_all) and written once, however many of its
+codes change. The writes are committed in WriteBatches of up to WRITE_BATCH_SIZE.
+"""
+
+import logging
+import time
+from locutus_util import WRITE_BATCH_SIZE
+from locutus_util.http_client import summarize_latencies
+
+
+def group_entries_by_mapping(entries):
+    """
+    Group the proposed systems by mapping document. Incomplete entries, and entries
+    without a known system, are skipped.
+
+    Returns:
+        dict: (terminology_id, mapping_id) > {code: proposed_system}
+    """
+    grouped = {}
+    for entry in entries:
+        term_id = entry["terminology_id"]
+        mapping_id = entry["mapping_id"]
+        code_to_update = entry["code"]
+        proposed_system = entry["proposed_system"]
+
+        if not all([term_id, mapping_id, code_to_update, proposed_system]) or proposed_system == "UNKNOWN":
+            logging.warning(f"Skipping incomplete entry: {entry}")
+            continue
+
+        # The first proposal for a code is used, as it was when each entry was written separately
+        grouped.setdefault((term_id, mapping_id), {}).setdefault(code_to_update, proposed_system)
+
+    return grouped
+
+
+def patch_codes(codes, code_systems, should_update):
+    """
+    Set the proposed system on each matching code entry, in place.
+
+    Returns:
+        int: Number of code entries changed.
+    """
+    changed = 0
+    for code_entry in codes:
+        proposed_system = code_systems.get(code_entry.get("code"))
+        if proposed_system is not None and should_update(code_entry):
+            code_entry["system"] = proposed_system
+            changed += 1
+    return changed
+
+
+def update_mapping_systems(db, entries, should_update=lambda code_entry: True, batch_size=WRITE_BATCH_SIZE):
+    """
+    Updates Firestore mapping documents with the proposed system values.
+
+    Args:
+        db (Client): The Firestore client.
+        entries (list): Scan entries with terminology_id, mapping_id, code and proposed_system.
+        should_update (callable): code entry > True if its system may be replaced.
+        batch_size (int): Documents read and written per batch.
+
+    Returns:
+        int: Number of mapping documents updated.
+    """
+    grouped = group_entries_by_mapping(entries)
+    keys = list(grouped)
+
+    updated_count = 0
+    codes_updated = 0
+    commit_latencies = []
+
+    for start in range(0, len(keys), batch_size):
+        chunk = keys[start:start + batch_size]
+        refs = [
+            db.collection("Terminology").document(term_id).collection("mappings").document(mapping_id)
+            for term_id, mapping_id in chunk
+        ]
+        keys_by_path = dict(zip((ref.path for ref in refs), chunk))
+        found = set()
+        batch = db.batch()
+        batch_docs = []
+
+        for snapshot in db.get_all(refs, field_paths=["codes"]):
+            term_id, mapping_id = keys_by_path[snapshot.reference.path]
+            found.add((term_id, mapping_id))
+            mapping_data = snapshot.to_dict() if snapshot.exists else None
+            if not mapping_data:
+                logging.warning(f"Mapping document not found: {term_id}/{mapping_id}")
+                continue
+
+            codes = mapping_data.get("codes", [])
+            changed = patch_codes(codes, grouped[(term_id, mapping_id)], should_update)
+            if changed:
+                batch.update(snapshot.reference, {"codes": codes})
+                batch_docs.append((term_id, mapping_id, changed))
+
+        for term_id, mapping_id in chunk:
+            if (term_id, mapping_id) not in found:
+                logging.warning(f"Mapping document not found: {term_id}/{mapping_id}")
+
+        if not batch_docs:
+            continue
+
+        try:
+            commit_start = time.perf_counter()
+            batch.commit()
+            commit_latencies.append(time.perf_counter() - commit_start)
+        except Exception as e:
+            for term_id, mapping_id, _ in batch_docs:
+                logging.error(f"Failed to update mapping {term_id}/{mapping_id}: {e}")
+            continue
+
+        for term_id, mapping_id, changed in batch_docs:
+            logging.info(f"Updated mapping: {term_id}/{mapping_id}, {changed} codes")
+        updated_count += len(batch_docs)
+        codes_updated += sum(changed for _, _, changed in batch_docs)
+
+    logging.info(f"Updated {updated_count} mappings({codes_updated} codes) with proposed systems.")
+    summary = summarize_latencies(commit_latencies)
+    if summary["count"]:
+        logging.info(
+            f"Committed {summary['count']} batches. p50 {summary['p50']:.0f} ms, "
+            f"p90 {summary['p90']:.0f} ms, max {summary['max']:.0f} ms"
+        )
+
+    return updated_count
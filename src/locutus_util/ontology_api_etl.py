@@ -12,32 +12,100 @@ Currently filtering out 'loinc' and 'monarch' API ontologies. FD-1703
 """
 
 import argparse
-import requests
-import pandas as pd
-import numpy as np
+import hashlib
+import json
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 from typing import List
-from google.cloud import firestore
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from locutus_util import *
+from locutus_util.http_client import run_concurrently
+from locutus_util.http_cache import cached_get_json, configure_http_cache, get_response_cache
+from locutus_util.reference_data import get_curated_ontologies, get_curated_ontology_ids
+from locutus_util.stage_cache import StageCache, digest, file_digest
+from locutus_util.helpers import set_logging_config
 
-UMLS_API_KEY = get_api_key("umls")
-
-extracted_data = []  # Collects the manual ontology data
+# Actions(-a/--action)
+FETCH_AND_UPLOAD = "fetch_and_upload"  # Fetch the APIs, update the csvs and upload to Firestore
+UPLOAD_FROM_CSV = "upload_from_csv"  # Upload the existing csv to Firestore
+UPDATE_CSV = "update_csv"  # Fetch the APIs and update the csvs only
 
 def fetch_data(url):
-    response = requests.get(url)
-    logger.info(f'{url}')
-    if response.status_code == 200:
-        return response.json()
-    else:
+    """GET a url through the on-disk response cache(see http_cache). None unless 200."""
+    return cached_get_json(url)
+
+def with_query_params(url, **params):
+    """Return the url with the query parameters added or replaced."""
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query.update({key: str(value) for key, value in params.items()})
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def ols_page_urls(data, url):
+    """Urls of the pages after the first, from the OLS 'page' metadata."""
+    page = data.get("page")
+    if not page or "totalPages" not in page:
+        return None
+    return [
+        with_query_params(url, page=number, size=page["size"])
+        for number in range(page.get("number", 0) + 1, page["totalPages"])
+    ]
+
+def umls_page_urls(data, url):
+    """Urls of the pages after the first, from the UMLS 'pageCount' metadata."""
+    if "pageCount" not in data:
         return None
+    return [
+        with_query_params(url, pageNumber=number)
+        for number in range(data.get("pageNumber", 1) + 1, data["pageCount"] + 1)
+    ]
+
+def next_page_url(data):
+    return data.get("_links", {}).get("next", {}).get("href")
+
+def fetch_all_pages(url, page_urls, max_workers=HTTP_MAX_WORKERS):
+    """
+    Fetch every page of a paginated endpoint.
+
+    The page count is read from the first response and the remaining pages are
+    fetched concurrently. If the count is unknown, `_links.next` is followed one
+    page at a time.
+
+    Args:
+        url (str): Url of the first page.
+        page_urls (callable): (first page, url) > urls of the remaining pages, or None.
+
+    Returns:
+        list: The page responses, in page order. Pages that failed are skipped.
+    """
+    data = fetch_data(url)
+    if not data:
+        return []
+
+    remaining = page_urls(data, url)
+    if remaining is not None:
+        return [data] + [page for page in run_concurrently(fetch_data, remaining, max_workers) if page]
+
+    pages = [data]
+    next_url = next_page_url(data)
+    while next_url:
+        data = fetch_data(next_url)
+        if not data:
+            break
+        pages.append(data)
+        next_url = next_page_url(data)
+    return pages
 
 def collect_ols_data(ols_ontologies_url=f"{OLS_API_BASE_URL}ontologies"):
     logger.info("Fetching ols data")
-    data = fetch_data(ols_ontologies_url)
+    pages = fetch_all_pages(ols_ontologies_url, ols_page_urls)
     logger.info("Transforming ols data")
 
-    while data:
+    extracted_data = []  # Initialize a list to store the extracted data
+
+    for data in pages:
         ontologies = data['_embedded']['ontologies']
         for ontology in ontologies:
             config = ontology.get('config', {})
@@ -53,31 +121,33 @@ def collect_ols_data(ols_ontologies_url=f"{OLS_API_BASE_URL}ontologies"):
                 'version': config.get('versionIri', '')
             })
 
-        # Check if there is a next page
-        if '_links' in data and 'next' in data['_links']:
-            next_url = data['_links']['next']['href']
-            data = fetch_data(next_url)
-        else:
-            break
-
     return extracted_data
 
 
-def collect_umls_data(umls_ontologies_url=f"{UMLS_API_BASE_URL}metadata/current/sources?apiKey={UMLS_API_KEY}"):
+def collect_umls_data(umls_ontologies_url=None):
     """
     Collects ontology data from the UMLS API.
 
+    Args:
+        umls_ontologies_url (str): Defaults to the UMLS sources endpoint, using the
+            UMLS_API_KEY environment variable. The key is only required when called.
+
     Returns:
         list: Transformed data from UMLS API.
     """
+    if umls_ontologies_url is None:
+        umls_ontologies_url = (
+            f"{UMLS_API_BASE_URL}metadata/current/sources?apiKey={get_api_key('umls')}"
+        )
+
     logger.info(f"Fetching umls data")
 
-    data = fetch_data(umls_ontologies_url)
+    pages = fetch_all_pages(umls_ontologies_url, umls_page_urls)
     logger.info("Transforming umls data")
 
     extracted_data = []  # Initialize a list to store the extracted data
 
-    while data:
+    for data in pages:
         results = data.get("result", [])
         if not isinstance(results, list):
             raise TypeError("Expected 'result' to be a list.")
@@ -98,16 +168,22 @@ def collect_umls_data(umls_ontologies_url=f"{UMLS_API_BASE_URL}metadata/current/
                 }
             )
 
-        # Fetch the next page if available
-        next_url = data.get("_links", {}).get("next", {}).get("href")
-        if next_url:
-            data = fetch_data(next_url)
-        else:
-            break
-
     return extracted_data
 
 
+def collect_api_data(ols_ontologies_url, umls_ontologies_url):
+    """
+    Collect the OLS and UMLS data at the same time.
+
+    Returns:
+        tuple: (ols data, umls data)
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        ols_future = executor.submit(collect_ols_data, ols_ontologies_url)
+        umls_future = executor.submit(collect_umls_data, umls_ontologies_url)
+        return ols_future.result(), umls_future.result()
+
+
 def add_manual_ontologies():
     return [
         {
@@ -133,19 +209,22 @@ def add_manual_ontologies():
 
     ]
 
-def add_monarch_ontologies():
+def add_monarch_ontologies(ols_data):
     """Monarch API does not keep data on the ontologies themselves. Using a
     list of ontologies found in Monarch, backfill the information using the
     data collected from the OLS API.
     
     If some ontologies are not present in OLS, add those with add_manual_ontologies.
+
+    Args:
+        ols_data (list): Output of collect_ols_data.
     """
     monarch_ontologies = ['CHEBI', 'ECTO', 'GO', 'HP', 'MAXO', 'MONDO', 'MP', 
                           'NBO', 'PATO', 'RO', 'SNOMED', 'UBERON']
 
     # Create new entries based on existing OLS data
     monarch_ols = []
-    for ontology in extracted_data:
+    for ontology in ols_data:
         if ontology['curie'] in monarch_ontologies:
             new_entry = {
                 'api_url': MONARCH_API_BASE_URL,
@@ -178,6 +257,8 @@ def backfill_data_from_csv(combined_data: List, hc_ontology_data):
     Insert hardcoded UMLS systems.
     Example: Replace with hard coded system where one is specified, no update if not specified.
     """
+    import numpy as np
+    import pandas as pd
 
     combined_data = pd.DataFrame(combined_data)
 
@@ -194,11 +275,61 @@ def backfill_data_from_csv(combined_data: List, hc_ontology_data):
     return combined_data
 
 
+def content_hash(value):
+    """Hash of a Firestore value, independent of key order."""
+    encoded = json.dumps(value, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def diff_ontology_api(current, data):
+    """
+    Field-path updates that turn the `current` document into `data`.
+
+    Changed top-level fields are replaced. Ontologies are compared one at a time,
+    so only new and changed entries are written, and removed entries are deleted.
+
+    Returns:
+        dict: field path > value, for DocumentReference.update(). Empty if equal.
+    """
+    from google.cloud import firestore
+
+    updates = {}
+    for field in current.keys() - data.keys():
+        updates[firestore.FieldPath(field).to_api_repr()] = firestore.DELETE_FIELD
+    for field, value in data.items():
+        if field != 'ontologies' and current.get(field) != value:
+            updates[firestore.FieldPath(field).to_api_repr()] = value
+
+    current_ontologies = current.get('ontologies')
+    ontologies = data['ontologies']
+    if not isinstance(current_ontologies, dict):
+        updates['ontologies'] = ontologies
+        return updates
+
+    for key, entry in ontologies.items():
+        if key not in current_ontologies or content_hash(current_ontologies[key]) != content_hash(entry):
+            updates[firestore.FieldPath('ontologies', key).to_api_repr()] = entry
+    for key in current_ontologies.keys() - ontologies.keys():
+        updates[firestore.FieldPath('ontologies', key).to_api_repr()] = firestore.DELETE_FIELD
+
+    return updates
+
+
 def add_ontology_api(db, api_id, api_url, api_name, ontologies):
+    """
+    Write the OntologyAPI/{api_id} document, only if its content changed.
+
+    A new document is created with set(). An existing document is updated with
+    the per-ontology diff, and left untouched when the content hashes match.
+
+    Returns:
+        str: 'created', 'updated' or 'unchanged'
+    """
     collection_title = 'OntologyAPI'
     ontology_api_ref = db.collection(collection_title)
 
     document_id = api_id
+    doc_ref = ontology_api_ref.document(document_id)
 
     data = {
         'api_id': api_id,
@@ -207,78 +338,94 @@ def add_ontology_api(db, api_id, api_url, api_name, ontologies):
         'ontologies': ontologies
     }
 
-    ontology_api_ref.document(document_id).set(data)
-    logger.info(f"Created {document_id} document in the {collection_title} collection")
+    snapshot = doc_ref.get()
+    if not snapshot.exists:
+        doc_ref.set(data)
+        logger.info(f"Created {document_id} document in the {collection_title} collection")
+        return 'created'
+
+    current = snapshot.to_dict()
+    if content_hash(current) == content_hash(data):
+        logger.info(f"{document_id} document in the {collection_title} collection is unchanged")
+        return 'unchanged'
+
+    updates = diff_ontology_api(current, data)
+    doc_ref.update(updates)
+    logger.info(
+        f"Updated {len(updates)} fields of the {document_id} document in the {collection_title} collection"
+    )
+    return 'updated'
 
-def reorg_for_firestore(filtered_ontologies):
+def reorg_for_firestore(filtered_ontologies, curated_ontologies=None):
     """
-    Reads a CSV file and organizes the data by terminology_id.
-    
+    Organizes the ontology rows by api_id.
+
     Args:
-        file_path (str): The path to the CSV file.
-    
+        filtered_ontologies (DataFrame): Output of filter_firestore_ontologies.
+        curated_ontologies (set): Upper-cased curated ontology ids. Defaults to
+            those in included_ontologies.csv.
+
     Returns:
-        dict: A dictionary of terminology data grouped by terminology_id.
+        dict: api_id > {api_url, api_name, ontologies}. Ontologies are keyed by the
+        upper-cased ontology_code. Only the first row of each ontology with a
+        curie is kept.
     """
-    api_data = {}
-
-    # Easier format
-    csv_data = filtered_ontologies.to_dict(orient='records')
-    included_ontologies = pd.read_csv(INCLUDED_ONTOLOGIES_PATH)
-
-    # Get a list of the curated ontology curies.
-    curated_list = included_ontologies[
-        included_ontologies["Default to Include"] == "t"
-    ]["Id"].str.upper().tolist()
-
-    for entry in csv_data:
-        api_id = entry['api_id']
-        ontology_id = entry['ontology_code'].upper()
-
-        # Initialize the API entry if it doesn't exist
-        if api_id not in api_data:
-            api_data[api_id] = {
-                'api_url': entry['api_url'],
-                'api_name': entry['api_name'],
-                'ontologies': {}
-            }
+    if curated_ontologies is None:
+        curated_ontologies = get_curated_ontologies()
+
+    # api_url and api_name come from the first row of each api, in order of appearance
+    apis = filtered_ontologies.drop_duplicates(subset="api_id")
+    api_data = {
+        api_id: {'api_url': api_url, 'api_name': api_name, 'ontologies': {}}
+        for api_id, api_url, api_name in zip(
+            apis["api_id"].tolist(), apis["api_url"].tolist(), apis["api_name"].tolist()
+        )
+    }
 
-        # Only add the ontology if it doesn't already exist and has a curie
-        api_data_ontologies = {key.upper(): value for key, value in api_data[api_id]['ontologies'].items()}
-        if ontology_id not in api_data_ontologies and entry['curie']:
-            api_data[api_id]["ontologies"][ontology_id] = {
-                "ontology_title": entry["ontology_title"],
-                "ontology_code": entry["ontology_code"].lower(),
-                "curie": entry["curie"].upper(),
-                "system": entry["system"],
-                "version": entry["version"],
-                "short_list": ontology_id in curated_list,
-            }
+    # Rows without a curie(None or '') are skipped, and don't claim the ontology_id
+    ontologies = filtered_ontologies[filtered_ontologies["curie"].astype(bool)]
+    ontologies = ontologies.assign(
+        ontology_id=ontologies["ontology_code"].str.upper()
+    ).drop_duplicates(subset=["api_id", "ontology_id"])
+
+    for api_id, ontology_id, title, code, curie, system, version, short_list in zip(
+        ontologies["api_id"].tolist(),
+        ontologies["ontology_id"].tolist(),
+        ontologies["ontology_title"].tolist(),
+        ontologies["ontology_code"].str.lower().tolist(),
+        ontologies["curie"].str.upper().tolist(),
+        ontologies["system"].tolist(),
+        ontologies["version"].tolist(),
+        ontologies["ontology_id"].isin(curated_ontologies).tolist(),
+    ):
+        api_data[api_id]["ontologies"][ontology_id] = {
+            "ontology_title": title,
+            "ontology_code": code,
+            "curie": curie,
+            "system": system,
+            "version": version,
+            "short_list": short_list,
+        }
     return api_data
 
 
-def generate_db_csv(filtered_ontologies):
+def generate_db_csv(filtered_ontologies, output_file=OUTPUT_PATH / "ontology_api_metadata.csv"):
     """
     Generates a csv version of the data found in the database OntologyAPI collection
 
     """
-    included_ontologies = pd.read_csv(INCLUDED_ONTOLOGIES_PATH)
-
-    curated_list = (
-        included_ontologies[included_ontologies["Default to Include"] == "t"]["Id"]
-        .str.upper()
-        .tolist()
-    )
+    curated_list = get_curated_ontologies()
 
-    filtered_ontologies["short_list"] = (
-        filtered_ontologies["ontology_code"].str.upper().isin(curated_list)
+    # assign, so the caller's DataFrame is not modified
+    df = filtered_ontologies.assign(
+        short_list=filtered_ontologies["ontology_code"].str.upper().isin(curated_list)
     )
 
-    df = filtered_ontologies[
+    df = df[
         ["api_id", "curie", "ontology_title", "short_list", "system", "version"]
     ].sort_values(by=["api_id", "curie"])
 
-    df.to_csv(OUTPUT_PATH / "ontology_api_metadata.csv", index=False)
+    df.to_csv(output_file, index=False)
 
 
 def add_manual_additions_to_ontology_lookup(df):
@@ -294,6 +441,7 @@ def add_manual_additions_to_ontology_lookup(df):
     input system >  ontology lookup  > input system, linked to the current system 
     LOINC > LNC,http://loinc.org > LOINC,http://loinc.org
     '''
+    import pandas as pd
     manual_map = {
         "LOINC": "LNC",
         "MIM": "OMIM",
@@ -301,23 +449,18 @@ def add_manual_additions_to_ontology_lookup(df):
         "ORPHANET": "ORDO",
     }
 
-    new_rows = []
-
-    for input_sys, current_sys in manual_map.items():
-        # Find the row(s) in df with the current system code
-        matching_rows = df[df["curie"] == current_sys]
-
-        for _, row in matching_rows.iterrows():
-            # Create a copy of the row with the input system as the key
-            new_row = row.copy()
-            new_row["curie"] = input_sys
-            new_rows.append(new_row)
+    # A copy of the current_sys rows, keyed by the input system, for each entry
+    additions = [
+        df[df["curie"] == current_sys].assign(curie=input_sys)
+        for input_sys, current_sys in manual_map.items()
+    ]
 
-    # Add the new rows to the original DataFrame and drop duplicates if any
-    df_augmented = pd.concat([df, pd.DataFrame(new_rows)], ignore_index=True)
+    # Add the new rows to the original DataFrame
+    df_augmented = pd.concat([df, *additions], ignore_index=True)
     return df_augmented
 
-def update_seed_data_csv(data, csv_path):
+def update_seed_data_csv(data, csv_path, system_map_path=LOCUTUS_SYSTEM_MAP_PATH):
+    import pandas as pd
     # For data lineage
     data = pd.DataFrame(data)
     combined_df_sorted = data.sort_values(by=['curie', 'api_id'])
@@ -329,14 +472,16 @@ def update_seed_data_csv(data, csv_path):
     df = add_manual_additions_to_ontology_lookup(df)
     df.loc[:, "curie"] = df["curie"].str.upper()
     sys_mapping = df[~(df['curie'].isnull() | df['system'].isnull())].drop_duplicates(keep='first').reset_index(drop = True)
-    sys_mapping.to_csv(LOCUTUS_SYSTEM_MAP_PATH, index=False)
+    sys_mapping.to_csv(system_map_path, index=False)
     logger.info(f"The locutus_system_map.csv is updated.")
 
-def filter_firestore_ontologies(data, which_ontologies, included_ontologies):
+def filter_firestore_ontologies(data, which_ontologies, curated_ontology_ids):
     """
     Filter out 'monarch' and 'loinc'
     Filter out those without a 'system'
     Filter for the included ontologies(Optional - which_ontologies)
+
+    curated_ontology_ids: Ids flagged 'Default to Include' in included_ontologies.csv
     """
     # Exclude monarch and loinc
     filtered_data = data[~data['api_id'].str.lower().isin(['monarch','loinc'])]
@@ -349,9 +494,7 @@ def filter_firestore_ontologies(data, which_ontologies, included_ontologies):
 
     if which_ontologies == "curated_ontologies_only":
 
-        keepers = included_ontologies[included_ontologies["Default to Include"] == "t"][
-            "Id"
-        ].to_list()
+        keepers = list(curated_ontology_ids)
         filtered_data = filtered_data[(filtered_data["curie"].isin(keepers))]
         logger.info(
             f"Only the curated list of ontologies will be sent to the firestore. \
@@ -364,70 +507,196 @@ def filter_firestore_ontologies(data, which_ontologies, included_ontologies):
     return filtered_ontologies
 
 
-def ontology_api_etl(project_id, action, which_ontologies):
+def read_ontology_api_csv(csv_path):
+    """Read ontology_api.csv with nulls as None."""
+    import pandas as pd
+    csv_data = pd.read_csv(csv_path, keep_default_na=False, na_values=[''])
+    return csv_data.where(pd.notnull(csv_data), None)
 
-    # Initiate Firestore client and setting the project_id
-    db = firestore.Client(project_id)
 
-    # Initialize logger
-    log_file = f"{LOGS_PATH}/{date.today()}_ontology_api_etl.log"
-    set_logging_config(log_file)
+class EtlContext:
+    """
+    Settings and results of one ETL run.
+
+    Runs keep no module-level state, so several can run at once in one process
+    (ex. curated-only and all-ontologies). They share the pooled HTTP Session, the
+    response cache and the stage cache. Runs that write at the same time should
+    use different output paths.
+
+    Args:
+        action (str): FETCH_AND_UPLOAD, UPLOAD_FROM_CSV or UPDATE_CSV
+        which_ontologies (str): 'curated_ontologies_only' or 'all_ontologies'
+        db (firestore.Client): Required for the upload actions.
+        csv_path (Path): ontology_api.csv, written by the fetch and read by the upload.
+        system_map_path (Path): locutus_system_map.csv, written by the fetch.
+        db_csv_path (Path): ontology_api_metadata.csv, written by the upload.
+        stages (StageCache): Defaults to the shared stage cache.
+    """
 
-    # Define URLS, filepaths and other required resources
-    csv_path = ONTOLOGY_API_PATH  # Location to store fetched data
-    included_ontologies = pd.read_csv(
-        INCLUDED_ONTOLOGIES_PATH
-    )  # Read in the curated list of ontologies
-    hc_ontology_data = pd.read_csv(
-        MANUAL_ONTOLOGY_TRANSFORMS_PATH, delimiter=","
-    )  # Read in the file with the hardcoded ontology data
+    def __init__(self, action, which_ontologies, db=None, csv_path=ONTOLOGY_API_PATH,
+                 system_map_path=LOCUTUS_SYSTEM_MAP_PATH,
+                 db_csv_path=OUTPUT_PATH / "ontology_api_metadata.csv", stages=None):
+        self.action = action
+        self.which_ontologies = which_ontologies
+        self.db = db
+        self.csv_path = csv_path
+        self.system_map_path = system_map_path
+        self.db_csv_path = db_csv_path
+        self.stages = stages if stages is not None else StageCache()
+
+        # Results
+        self.api_data = None  # Combined rows from the APIs and manual ontologies
+        self.fs_data = None  # OntologyAPI documents, keyed by api_id
+        self.upload_results = Counter()  # created/updated/unchanged documents
+
+
+def fetch_stage(context):
+    """Fetch the API data and write ontology_api.csv and locutus_system_map.csv."""
+    import pandas as pd
+    response_cache = get_response_cache()
+    cache_only = response_cache is not None and response_cache.cache_only
+    # Cached responses are keyed by the redacted url, so any key finds them
+    UMLS_API_KEY = (os.getenv("UMLS_API_KEY") or "REDACTED") if cache_only else get_api_key("umls")
     ols_ontologies_url = f"{OLS_API_BASE_URL}ontologies"
-    UMLS_API_KEY = get_api_key("umls")
     umls_ontologies_url = (
         f"{UMLS_API_BASE_URL}metadata/current/sources?apiKey={UMLS_API_KEY}"
     )
 
-    # Collect data from sources
-    if action in {FETCH_AND_UPLOAD, UPDATE_CSV}:
-        # Collect OLS data
-        ols_data = collect_ols_data(ols_ontologies_url)
+    # Collect OLS and UMLS data concurrently
+    ols_data, umls_data = collect_api_data(ols_ontologies_url, umls_ontologies_url)
+
+    # Generate Monarch data
+    monarch_data = add_monarch_ontologies(ols_data)
 
-        # Collect UMLS data
-        umls_data = collect_umls_data(umls_ontologies_url)
+    # Add manual ontologies
+    manual_ontologies = add_manual_ontologies()
 
-        # Generate Monarch data
-        monarch_data = add_monarch_ontologies()
+    # Combine OLS and manual data
+    context.api_data = ols_data + umls_data + monarch_data + manual_ontologies
 
-        # Add manual ontologies
-        manual_ontologies = add_manual_ontologies()
+    logger.info(f'count ols data: {len(ols_data)}')
+    logger.info(f'count umls data: {len(umls_data)}')
 
-        # Combine OLS and manual data
-        combined_data = ols_data + umls_data + monarch_data + manual_ontologies
+    if response_cache is not None:
+        response_cache.log_stats()
 
-        logger.info(f'count ols data: {len(ols_data)}')
-        logger.info(f'count umls data: {len(umls_data)}')
+    # Stage results are keyed by their inputs. Editing this module reruns every stage.
+    code_digest = file_digest(__file__)
+
+    # Read in the file with the hardcoded ontology data
+    supplemented_data, supplemented_key = context.stages.run(
+        "supplement_data",
+        {
+            "api_data": digest(context.api_data),
+            "manual_transforms": file_digest(MANUAL_ONTOLOGY_TRANSFORMS_PATH),
+            "code": code_digest,
+        },
+        lambda: supplement_data(
+            context.api_data, pd.read_csv(MANUAL_ONTOLOGY_TRANSFORMS_PATH, delimiter=",")
+        ),
+    )
 
-        supplemented_data = supplement_data(combined_data, hc_ontology_data)
+    context.stages.run(
+        "update_seed_data_csv",
+        {
+            "supplemented_data": supplemented_key,
+            "output": [str(context.csv_path), str(context.system_map_path)],
+            "code": code_digest,
+        },
+        lambda: update_seed_data_csv(supplemented_data, context.csv_path, context.system_map_path),
+        outputs=[context.csv_path, context.system_map_path],
+    )
 
-        update_seed_data_csv(supplemented_data, csv_path)
 
-    if action in {FETCH_AND_UPLOAD, UPLOAD_FROM_CSV}:
-        # Read in data and handle nulls
-        csv_data = pd.read_csv(csv_path, keep_default_na=False, na_values=[''])
-        csv_data = csv_data.where(pd.notnull(csv_data), None)
+def upload_stage(context):
+    """Filter and reorganize ontology_api.csv, then write the changed OntologyAPI documents."""
+    code_digest = file_digest(__file__)
+    included_digest = file_digest(INCLUDED_ONTOLOGIES_PATH)
 
-        # Only include the cho-simba ones
-        filtered_ontologies = filter_firestore_ontologies(csv_data, which_ontologies, included_ontologies)
+    # Read in data and handle nulls. Only include the cho-simba ones
+    filtered_ontologies, filtered_key = context.stages.run(
+        "filter_firestore_ontologies",
+        {
+            "ontology_api": file_digest(context.csv_path),
+            "included_ontologies": included_digest,
+            "which_ontologies": context.which_ontologies,
+            "code": code_digest,
+        },
+        lambda: filter_firestore_ontologies(
+            read_ontology_api_csv(context.csv_path),
+            context.which_ontologies,
+            get_curated_ontology_ids(),
+        ),
+    )
 
-        # Reformat. Group ontologies by api.
-        fs_data = reorg_for_firestore(filtered_ontologies)
+    # Reformat. Group ontologies by api.
+    context.fs_data, _ = context.stages.run(
+        "reorg_for_firestore",
+        {"filtered_ontologies": filtered_key, "included_ontologies": included_digest, "code": code_digest},
+        lambda: reorg_for_firestore(filtered_ontologies),
+    )
 
-        # Generate a csv with the current ontology data in db
-        generate_db_csv(filtered_ontologies)
+    # Generate a csv with the current ontology data in db
+    context.stages.run(
+        "generate_db_csv",
+        {
+            "filtered_ontologies": filtered_key,
+            "included_ontologies": included_digest,
+            "output": str(context.db_csv_path),
+            "code": code_digest,
+        },
+        lambda: generate_db_csv(filtered_ontologies, context.db_csv_path),
+        outputs=[context.db_csv_path],
+    )
 
-        # Insert data into Firestore
-        for api_id, data in fs_data.items():
-            add_ontology_api(db, api_id, data['api_url'], data['api_name'], data['ontologies'])
+    # Insert data into Firestore. Only changed documents are written.
+    context.upload_results = Counter(
+        add_ontology_api(context.db, api_id, data['api_url'], data['api_name'], data['ontologies'])
+        for api_id, data in context.fs_data.items()
+    )
+    logger.info(f"OntologyAPI documents: {dict(context.upload_results)}")
+
+
+def run_etl(context):
+    """
+    Run the stages of the ETL selected by context.action.
+
+    Returns:
+        EtlContext: The context, with its results set.
+    """
+    if context.action in {FETCH_AND_UPLOAD, UPDATE_CSV}:
+        fetch_stage(context)
+
+    if context.action in {FETCH_AND_UPLOAD, UPLOAD_FROM_CSV}:
+        if context.db is None:
+            raise ValueError(f"A Firestore client is required for the '{context.action}' action")
+        upload_stage(context)
+
+    return context
+
+
+def ontology_api_etl(project_id, action, which_ontologies, use_stage_cache=True):
+    """
+    Args:
+        use_stage_cache (bool): Reuse the results of stages whose inputs(API data,
+            reference csvs, options and this module's code) are unchanged since an
+            earlier run. See stage_cache.
+    """
+    # Initialize logger
+    log_file = f"{LOGS_PATH}/{date.today()}_ontology_api_etl.log"
+    set_logging_config(log_file)
+
+    db = None
+    if action in {FETCH_AND_UPLOAD, UPLOAD_FROM_CSV}:
+        from google.cloud import firestore
+
+        # Initiate Firestore client and setting the project_id
+        db = firestore.Client(project_id)
+
+    context = EtlContext(
+        action, which_ontologies, db=db, stages=StageCache(enabled=use_stage_cache)
+    )
+    return run_etl(context)
 
 
 if __name__ == "__main__":
@@ -456,13 +725,37 @@ if __name__ == "__main__":
         ),
     )
 
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=HTTP_CACHE_TTL,
+        help="Seconds a cached API response is used before it is revalidated.",
+    )
+    parser.add_argument(
+        "--cache-only",
+        action="store_true",
+        help="Use only cached API responses. No requests are made to OLS or UMLS.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always download the API responses, without reading or writing the cache.",
+    )
+    parser.add_argument(
+        "--no-stage-cache",
+        action="store_true",
+        help="Rerun every stage, instead of reusing results for unchanged inputs.",
+    )
+
     args = parser.parse_args()
 
-    # Initiate Firestore client and setting the project_id
-    db = firestore.Client(project=args.project_id, database=args.database)
+    configure_http_cache(
+        enabled=not args.no_cache, ttl=args.cache_ttl, cache_only=args.cache_only
+    )
 
     ontology_api_etl(
-        project_id=args.project_id,
+        project_id=args.project,
         action=args.action,
         which_ontologies=args.which_ontologies,
+        use_stage_cache=not args.no_stage_cache,
     )
@@ -0,0 +1,177 @@
+"""
+Registry of lookups built from the reference files in data/input/ontology_data.
+
+Each lookup is built from its file once and kept in memory. The file's mtime and
+size are checked on every access, and the lookup is rebuilt when the file changes
+(ex. after ontology_api_etl rewrites locutus_system_map.csv).
+
+Built lookups are also written to a snapshot in data/cache. A new process uses the
+snapshot while the source file is unchanged, so it does not need to parse the csv.
+
+Usage:
+    from locutus_util.reference_data import get_system_map
+    system_lookup = get_system_map()
+"""
+
+import json
+import os
+import threading
+from locutus_util import (logger, CACHE_PATH, LOCUTUS_SYSTEM_MAP_PATH,
+                         INCLUDED_ONTOLOGIES_PATH, ONTOLOGY_API_PATH)
+
+SNAPSHOT_PATH = CACHE_PATH / "reference_data.json"
+SNAPSHOT_VERSION = 1
+
+_lookups = {}  # name > (path, builder, kind)
+_cache = {}  # name > (fingerprint, value)
+_snapshot = None
+_lock = threading.RLock()
+
+
+def register(name, path, kind="dict"):
+    """
+    Decorator that registers a builder for a lookup.
+
+    Args:
+        name (str): Name of the lookup.
+        path (Path): The reference file the lookup is built from.
+        kind (str): 'dict' or 'set'. Sets are returned as frozensets.
+    """
+    def decorator(builder):
+        _lookups[name] = (path, builder, kind)
+        return builder
+    return decorator
+
+
+def fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def get(name):
+    """Return the lookup, building or reloading it only if its file changed."""
+    path, builder, kind = _lookups[name]
+    current = fingerprint(path)
+
+    with _lock:
+        cached = _cache.get(name)
+        if cached is not None and cached[0] == current:
+            return cached[1]
+
+        snapshot_entry = load_snapshot().get(name)
+        if snapshot_entry is not None and snapshot_entry["fingerprint"] == current:
+            value = snapshot_entry["value"]
+            from_snapshot = True
+        else:
+            logger.debug(f"Building reference lookup '{name}' from {path}")
+            value = builder(path)
+            from_snapshot = False
+
+        if kind == "set":
+            value = frozenset(value)
+        _cache[name] = (current, value)
+
+        if not from_snapshot:
+            save_snapshot()
+
+    return value
+
+
+def load_snapshot():
+    global _snapshot
+    if _snapshot is None:
+        _snapshot = {}
+        try:
+            with open(SNAPSHOT_PATH, "r") as snapshot_file:
+                data = json.load(snapshot_file)
+            if data.get("version") == SNAPSHOT_VERSION:
+                _snapshot = data["lookups"]
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable reference snapshot {SNAPSHOT_PATH}: {e}")
+    return _snapshot
+
+
+def save_snapshot():
+    """Write every lookup built so far to the snapshot file."""
+    global _snapshot
+    with _lock:
+        lookups = dict(load_snapshot())
+        for name, (current, value) in _cache.items():
+            kind = _lookups[name][2]
+            lookups[name] = {
+                "fingerprint": current,
+                "value": sorted(value) if kind == "set" else value,
+            }
+
+        try:
+            SNAPSHOT_PATH.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = SNAPSHOT_PATH.with_suffix(".tmp")
+            with open(tmp_path, "w") as snapshot_file:
+                json.dump({"version": SNAPSHOT_VERSION, "lookups": lookups}, snapshot_file)
+            os.replace(tmp_path, SNAPSHOT_PATH)
+            _snapshot = lookups
+        except OSError as e:
+            logger.warning(f"Could not write reference snapshot {SNAPSHOT_PATH}: {e}")
+
+
+def clear():
+    """Forget the in-memory lookups. The snapshot file is left in place."""
+    global _snapshot
+    with _lock:
+        _cache.clear()
+        _snapshot = None
+
+
+@register("system_map", LOCUTUS_SYSTEM_MAP_PATH)
+def build_system_map(path):
+    """curie > system, from locutus_system_map.csv"""
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    return dict(zip(df["curie"], df["system"]))
+
+
+@register("curated_ontology_ids", INCLUDED_ONTOLOGIES_PATH, kind="set")
+def build_curated_ontology_ids(path):
+    """Ids flagged 'Default to Include' in included_ontologies.csv, as written."""
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    return df[df["Default to Include"] == "t"]["Id"].tolist()
+
+
+@register("curated_ontologies", INCLUDED_ONTOLOGIES_PATH, kind="set")
+def build_curated_ontologies(path):
+    """Ids flagged 'Default to Include' in included_ontologies.csv, upper-cased."""
+    return [ontology_id.upper() for ontology_id in get_curated_ontology_ids()]
+
+
+@register("ontology_api_systems", ONTOLOGY_API_PATH)
+def build_ontology_api_systems(path):
+    """curie > system, from ontology_api.csv. Rows missing either value are skipped."""
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    df = df[df["curie"].notna() & df["system"].notna()]
+    return {
+        str(curie).strip(): str(system).strip()
+        for curie, system in zip(df["curie"], df["system"])
+    }
+
+
+def get_system_map():
+    return get("system_map")
+
+
+def get_curated_ontology_ids():
+    return get("curated_ontology_ids")
+
+
+def get_curated_ontologies():
+    return get("curated_ontologies")
+
+
+def get_ontology_api_systems():
+    return get("ontology_api_systems")
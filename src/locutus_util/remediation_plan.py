@@ -0,0 +1,274 @@
+"""
+Plan files for the remediations, so a scan's results can be applied later without
+scanning again.
+
+A remediation writes its review csv and a plan, a json file next to it in data/logs
+with the changes for each document and the update time the document had when it was
+scanned. Applying the plan writes each document with a `last_update_time`
+precondition. A document that changed since the scan is skipped and reported,
+rather than overwritten.
+
+Plan layout(version 1):
+    {"version": 1, "kind": "update_systems" | "delete_documents", "created": ...,
+     "project_id": ..., "database": ..., "only_missing": bool,
+     "documents": [{"path": ..., "parts": [...], "update_time": ..., "systems": {code: system}}]}
+
+Documents scanned from a snapshot have no update_time. They are written if they
+still exist, without a check for changes.
+
+Apply a plan:
+`python -m locutus_util.remediation_plan data/logs/20250101_000000_locutus-dev_None_missing_sys_plan.json`
+Options:
+-p/-db apply to a different project/database than the one scanned
+-y apply without asking for confirmation
+"""
+
+import argparse
+import json
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from locutus_util import logger, DELETE_MAX_ATTEMPTS, WRITE_BATCH_SIZE
+
+PLAN_VERSION = 1
+UPDATE_SYSTEMS = "update_systems"
+DELETE_DOCUMENTS = "delete_documents"
+
+# google.rpc.Codes of writes that are not retried
+NOT_FOUND = 5  # The document was deleted since the scan
+FAILED_PRECONDITION = 9  # The document changed since the scan
+
+
+class PlanVersionError(ValueError):
+    """Raised when a plan file was written by an incompatible version."""
+
+
+def format_update_time(update_time):
+    """RFC 3339 string of a document update time. Keeps nanoseconds when present."""
+    if update_time is None:
+        return None
+    if hasattr(update_time, "rfc3339"):
+        return update_time.rfc3339()
+    return update_time.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def parse_update_time(value):
+    if value is None:
+        return None
+    from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+    return DatetimeWithNanoseconds.from_rfc3339(value)
+
+
+def document_ref(db, parts):
+    """Reference from alternating collection and document ids. Ids may contain '/'."""
+    reference = db.collection(parts[0])
+    for index, part in enumerate(parts[1:]):
+        reference = reference.document(part) if index % 2 == 0 else reference.collection(part)
+    return reference
+
+
+def new_plan(kind, project_id, database, documents, **options):
+    return {
+        "version": PLAN_VERSION,
+        "kind": kind,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "project_id": project_id,
+        "database": database,
+        **options,
+        "documents": documents,
+    }
+
+
+def build_update_plan(entries, project_id, database, only_missing=False):
+    """
+    Plan of mapping system updates, from the entries of a system scan.
+
+    Args:
+        entries (list): Scan entries with terminology_id, mapping_id, code,
+            proposed_system and update_time.
+        only_missing (bool): Only set the system of codes that have none.
+    """
+    from locutus_util.mapping_updates import group_entries_by_mapping
+
+    update_times = {
+        (entry["terminology_id"], entry["mapping_id"]): entry.get("update_time")
+        for entry in entries
+    }
+    documents = [
+        {
+            "path": f"Terminology/{term_id}/mappings/{mapping_id}",
+            "parts": ["Terminology", term_id, "mappings", mapping_id],
+            "update_time": format_update_time(update_times[(term_id, mapping_id)]),
+            "systems": code_systems,
+        }
+        for (term_id, mapping_id), code_systems in group_entries_by_mapping(entries).items()
+    ]
+    return new_plan(UPDATE_SYSTEMS, project_id, database, documents, only_missing=only_missing)
+
+
+def build_delete_plan(invalid_ids, project_id, database):
+    """
+    Args:
+        invalid_ids (list): (terminology_id, subcollection_id, document_id, reference, update_time)
+    """
+    documents = [
+        {
+            "path": doc_ref.path,
+            "parts": ["Terminology", term_id, subcoll_id, doc_id],
+            "update_time": format_update_time(update_time),
+        }
+        for term_id, subcoll_id, doc_id, doc_ref, update_time in invalid_ids
+    ]
+    return new_plan(DELETE_DOCUMENTS, project_id, database, documents)
+
+
+def save_plan(plan, path):
+    with open(path, "w", encoding="utf-8") as plan_file:
+        json.dump(plan, plan_file, indent=2)
+    logger.info(f"Plan of {len(plan['documents'])} documents saved to {path}")
+
+
+def load_plan(path):
+    with open(path, "r", encoding="utf-8") as plan_file:
+        plan = json.load(plan_file)
+    if plan.get("version") != PLAN_VERSION:
+        raise PlanVersionError(f"{path} is plan version {plan.get('version')}, expected {PLAN_VERSION}")
+    return plan
+
+
+class PlanWriter:
+    """
+    Queues the plan's writes on a BulkWriter and counts the outcomes: written,
+    changed(since the scan), missing and failed.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.results = Counter()
+        self._lock = threading.Lock()
+        self._bulk_writer = db.bulk_writer()
+        self._bulk_writer.on_write_result(self._on_write_result)
+        self._bulk_writer.on_write_error(self._on_write_error)
+
+    def option(self, update_time):
+        if update_time is None:
+            return self.db.write_option(exists=True)
+        return self.db.write_option(last_update_time=parse_update_time(update_time))
+
+    def _count(self, outcome):
+        with self._lock:
+            self.results[outcome] += 1
+
+    def _on_write_result(self, reference, result, bulk_writer):
+        self._count("written")
+
+    def _on_write_error(self, error, bulk_writer):
+        reference = error.operation.reference
+        if error.code == FAILED_PRECONDITION:
+            logger.warning(f"Skipped {reference.path}, it changed since the scan")
+            self._count("changed")
+            return False
+        if error.code == NOT_FOUND:
+            logger.warning(f"Skipped {reference.path}, it was deleted since the scan")
+            self._count("missing")
+            return False
+        if error.attempts < DELETE_MAX_ATTEMPTS:
+            return True
+        logger.error(f"Failed to write document {reference.path}: {error.message}")
+        self._count("failed")
+        return False
+
+    def update_systems(self, documents, only_missing, batch_size=WRITE_BATCH_SIZE):
+        from locutus_util.mapping_updates import patch_codes
+
+        should_update = (lambda code_entry: not code_entry.get("system")) if only_missing else (lambda code_entry: True)
+        for start in range(0, len(documents), batch_size):
+            chunk = documents[start:start + batch_size]
+            refs = [document_ref(self.db, document["parts"]) for document in chunk]
+            planned = {ref.path: document for ref, document in zip(refs, chunk)}
+
+            for snapshot in self.db.get_all(refs, field_paths=["codes"]):
+                document = planned[snapshot.reference.path]
+                mapping_data = snapshot.to_dict() if snapshot.exists else None
+                if not mapping_data:
+                    logger.warning(f"Mapping document not found: {document['path']}")
+                    self._count("missing")
+                    continue
+
+                codes = mapping_data.get("codes", [])
+                if not patch_codes(codes, document["systems"], should_update):
+                    self._count("unchanged")
+                    continue
+                self._bulk_writer.update(snapshot.reference, {"codes": codes},
+                                         option=self.option(document["update_time"]))
+
+    def delete_documents(self, documents):
+        for document in documents:
+            self._bulk_writer.delete(document_ref(self.db, document["parts"]),
+                                     option=self.option(document["update_time"]))
+
+    def close(self):
+        self._bulk_writer.close()
+
+
+def apply_plan(db, plan):
+    """
+    Write a plan's changes. Each document is read and written at most once, and
+    documents that changed since the scan are left as they are.
+
+    Returns:
+        Counter: Documents written, changed, missing, unchanged and failed.
+    """
+    writer = PlanWriter(db)
+    try:
+        if plan["kind"] == UPDATE_SYSTEMS:
+            writer.update_systems(plan["documents"], plan.get("only_missing", False))
+        elif plan["kind"] == DELETE_DOCUMENTS:
+            writer.delete_documents(plan["documents"])
+        else:
+            raise ValueError(f"Unknown plan kind: {plan['kind']}")
+    finally:
+        writer.close()
+
+    unchecked = sum(1 for document in plan["documents"] if document["update_time"] is None)
+    if unchecked:
+        logger.warning(f"{unchecked} documents had no update time in the plan, and were written without a change check")
+    logger.info(
+        f"Applied {plan['kind']} plan: "
+        + ", ".join(f"{count} {outcome}" for outcome, count in sorted(writer.results.items()))
+    )
+    return writer.results
+
+
+def main(plan_path, project_id=None, database=None, assume_yes=False):
+    from locutus_util.snapshot import open_database
+
+    plan = load_plan(plan_path)
+    project_id = project_id or plan["project_id"]
+    database = database or plan["database"]
+    if not project_id:
+        raise ValueError(f"{plan_path} was scanned from a snapshot. Use -p to choose the project to apply it to.")
+
+    logger.info(
+        f"{plan['kind']} plan from {plan['created']}: {len(plan['documents'])} documents "
+        f"in {project_id}/{database}"
+    )
+    if not assume_yes:
+        confirm = input("Apply this plan? [y/N]: ").strip().lower()
+        if confirm != "y":
+            logger.info("Plan not applied.")
+            return None
+
+    return apply_plan(open_database(project_id, database), plan)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply a remediation plan file.")
+    parser.add_argument("plan", help="Plan file written by a remediation scan")
+    parser.add_argument('-p', '--project_id', required=False, help="GCP Project to edit. Defaults to the project scanned.")
+    parser.add_argument('-db', '--database', required=False, help="Database to edit. Defaults to the database scanned.")
+    parser.add_argument('-y', '--yes', action='store_true', help="Apply without asking for confirmation")
+
+    args = parser.parse_args()
+    main(args.plan, project_id=args.project_id, database=args.database, assume_yes=args.yes)
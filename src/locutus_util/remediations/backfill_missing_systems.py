@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 '''
-Suggestion: Uncomment lines ~41-42 while doing initial troubleshooting/setup. Also,
-any runs of get_distinct_mapping_systems. This function will also crawl through
-the db. Try not to run when it is not needed, to keep down hits to the db.
+Suggestion: Use -s/--snapshot while doing initial troubleshooting/setup. Also,
+any runs of get_distinct_mapping_systems crawl through the db. To get every
+remediation report from one crawl, run locutus_util/scan_engine.py instead.
 
 Updates the system of a mapping if the attribute is missing, or an empty string.
 Searches the Terminology Collections mappings, collecting doc references to update.
@@ -10,6 +10,8 @@ Uses locutus/search-dragon to find the systems by searching the defined api(umls
 Prints a csv of edits to review before performing the update.
     Search for UNKNOWN in the csv, for any issues
 After update confirmation, replaces the systems in the docs referenced.
+A plan(*_plan.json) is saved next to the csv. If the update is declined, apply it
+later with remediation_plan.py, without scanning again. Docs changed since the scan are skipped.
 Log will print for confirmation. 
     Check for error messages, and/or run again to scan.
 
@@ -17,184 +19,146 @@ Suggestion: Place both printouts in the ticket for documentation
 '''
 
 import argparse
-from google.cloud import firestore
 import logging
 from datetime import datetime
-from locutus_util.common import LOGS_PATH
+from locutus_util.snapshot import open_database
+from locutus_util.mapping_updates import update_mapping_systems as update_systems
+from locutus_util.system_inference import get_system_index
+from locutus_util.system_normalizer import get_normalizer
+from locutus_util.reference_data import get_ontology_api_systems
+from locutus_util.scan_engine import MissingSystemVisitor, scan_terminology
 from locutus_util.helpers import (set_logging_config, write_file)
+from locutus_util import LOGS_PATH, HTTP_MAX_WORKERS
+from locutus_util.http_client import run_concurrently
+from locutus_util.http_replay import replayable
+from locutus_util.search_cache import get_search_cache, search_scope
 from locutus.model.ontologies_search import OntologyAPISearchModel
-from locutus_util.analysis.get_distinct_mapping_systems import main as get_distinct_mapping_systems
+from locutus_util.remediation_plan import build_update_plan, save_plan, apply_plan
 
-def scan(db, issue_log_path):
+# Recorded/replayed when LOCUTUS_HTTP_MODE is set(see http_replay)
+run_search_dragon = replayable("search_dragon", OntologyAPISearchModel.run_search_dragon)
+
+def scan(db, issue_log_path, ontology_lookup=None):
     """
     Scans the 'mappings' subcollection of all documents in 'Terminology',
     and returns a list of codes that are missing the 'system' field or have it null/empty.
     """
-    missing_system_entries = []
-
-    term_docs = db.collection("Terminology").list_documents()
-    total_missing = 0
-
-    for term_doc in term_docs:
-        term_id = term_doc.id
-        mappings_ref = term_doc.collection("mappings")
-        # if total_missing >= 10:
-        #     continue
-        for mapping_doc in mappings_ref.stream():
-            data = mapping_doc.to_dict()
-            codes = data.get("codes", [])
-            for code_entry in codes:
-                system = code_entry.get("system")
-                if system is None or system == "" or system == "UK Biobank":
-                    proposed_system = propose_system_for_code(code_entry.get("code"))
-                    mapping_dict = {
-                        "terminology_id": term_id,
-                        "mapping_id": mapping_doc.id,
-                        "code": code_entry.get("code"),
-                        "display": code_entry.get("display"),
-                        "system": system,
-                        "proposed_system": proposed_system
-                    }
-                    missing_system_entries.append(mapping_dict)
-                    total_missing += 1
-                    logging.info(f"Mapping missing proposed_system: {mapping_dict}")
-    logging.info(f"Total missing system entries: {total_missing}")
-
-
-    return missing_system_entries
+    visitor = MissingSystemVisitor(code_system_proposer(ontology_lookup))
+    scan_terminology(db, [visitor])
+
+    return visitor.entries
+
+def code_system_proposer(ontology_lookup=None):
+    """
+    Returns a function that proposes a system for each of a list of codes, based on
+    the prefix or pattern of the code(see system_inference). Proposed short names are
+    replaced by their system url where the lookup has one(see system_normalizer).
+    """
+    index = get_system_index()
+    normalizer = get_normalizer(ontology_lookup if ontology_lookup is not None else get_ontology_api_systems())
+
+    def propose(codes):
+        systems = index.classify(codes)
+        # Short names without a system url in the lookup are proposed as they are
+        return [
+            system_url or system
+            for system, system_url in zip(systems, normalizer.normalize_many(systems, default=None))
+        ]
+
+    return propose
 
 def propose_system_for_code(code):
     """
     Proposes a system based on the prefix or pattern of the code.
     """
-    if not code:
-        return None
-    
-    prefix_map = {
-        "SNOMED": "SNOMED",
-        "LA": "LOINC",
-        "LP": "LOINC",
-        "MTH": "MIM",
-        "XAO": "XAO",
-        "ZFA": "ZFA",
-        "UBERON": "UBERON",
-        "SO": "SO",
-        "OMIT": "OMIT",
-        "OBA": "OBA",
-        "NCIT": "NCIT",
-        "MA": "MA",
-        "HP": "HP",
-        "FMA": "FMA",
-        "BTO": "BTO",
-        "ExO": "ExO",
-        "EMAPA": "EMAPA",
-        "CL": "CL",
-        "LEPAO": "LEPAO",
-        "NCRO": "NCRO",
-        "OARCS": "OARCS",
-    }
-
-
-    for prefix, system in prefix_map.items():
-        if code.startswith(prefix):
-            return system
-
-    return "UNKNOWN"
-
-def batch_search_concepts(keywords, ontologies, search_api_list=['umls'], results_per_page=10, start_index=0):
+    return code_system_proposer()([code])[0]
+
+def search_concept(concept, ontologies, search_api_list=['umls'], results_per_page=10, start_index=0):
+    """
+    Returns:
+        str: The system of the first search result, UNKNOWN if there are none, or ERROR.
+    """
+    try:
+        logging.info(f"Searching for concept: {concept}")
+        result = run_search_dragon(
+            concept,
+            ontologies,
+            search_api_list,
+            results_per_page=results_per_page,
+            start_index=start_index
+        )
+
+        # Extract 'system' from the first result in 'results'
+        if isinstance(result, dict) and result.get("results"):
+            first_hit = result["results"][0]
+            return first_hit.get("system", "UNKNOWN")
+        return "UNKNOWN"
+
+    except Exception as e:
+        logging.error(f"Error searching for {concept}: {e}")
+        return "ERROR"
+
+def batch_search_concepts(keywords, ontologies, search_api_list=['umls'], results_per_page=10, start_index=0,
+                          max_workers=HTTP_MAX_WORKERS, use_cache=True):
     """
     Runs `run_search` for each unique concept in the list and collects the results.
 
+    Concepts found in the search cache are not searched again. The rest are searched
+    concurrently, and their results(except errors) are added to the cache.
+
     Args:
         keywords (List): codes
         ontologies (List): List of ontologies to search in.
         search_api_list (List, optional): APIs to use. HARDCODING UMLS
         results_per_page (int): Number of results to retrieve per page.
         start_index (int): Starting index for pagination.
+        max_workers (int): Searches in flight at once.
+        use_cache (bool): Read and write the search cache.
 
     Returns:
         dict: Dictionary mapping each concept to its corresponding search results.
     """
 
     # Ensure keywords are valid strings
-    valid_strings = [s for s in keywords if isinstance(s, str) and s.strip()]
-
-    simplified_results = {}
-
-    for concept in valid_strings:
-        try:
-            logging.info(f"Searching for concept: {concept}")
-            result = OntologyAPISearchModel.run_search_dragon(
-                concept,
-                ontologies,
-                search_api_list,
-                results_per_page=results_per_page,
-                start_index=start_index
-            )
-
-            # Extract 'system' from the first result in 'results'
-            if isinstance(result, dict) and result.get("results"):
-                first_hit = result["results"][0]
-                system_url = first_hit.get("system", "UNKNOWN")
-                simplified_results[concept] = system_url
-            else:
-                simplified_results[concept] = "UNKNOWN"
-
-        except Exception as e:
-            logging.error(f"Error searching for {concept}: {e}")
-            simplified_results[concept] = "ERROR"
-
-    return simplified_results
+    valid_strings = list(dict.fromkeys(s for s in keywords if isinstance(s, str) and s.strip()))
+
+    cache = get_search_cache() if use_cache else None
+    scope = search_scope(ontologies, search_api_list, start_index)
+    simplified_results = cache.get_many(scope, valid_strings) if cache else {}
+
+    to_search = [concept for concept in valid_strings if concept not in simplified_results]
+    systems = run_concurrently(
+        lambda concept: search_concept(concept, ontologies, search_api_list, results_per_page, start_index),
+        to_search,
+        max_workers=max_workers,
+    )
+    searched = dict(zip(to_search, systems))
+    simplified_results.update(searched)
+
+    if cache:
+        cache.put_many(scope, {concept: system for concept, system in searched.items() if system != "ERROR"})
+        cache.log_stats()
+
+    return {concept: simplified_results[concept] for concept in valid_strings}
 
 def update_mapping_systems(db, entries):
     """
     Updates Firestore mapping documents with the proposed system values.
+    Only codes that still have no system are changed.
     """
-    updated_count = 0
-    for entry in entries:
-        term_id = entry["terminology_id"]
-        mapping_id = entry["mapping_id"]
-        code_to_update = entry["code"]
-        proposed_system = entry["proposed_system"]
-
-        if not all([term_id, mapping_id, code_to_update, proposed_system]) or proposed_system == "UNKNOWN":
-            logging.warning(f"Skipping incomplete entry: {entry}")
-            continue
-
-        mapping_ref = db.collection("Terminology").document(term_id).collection("mappings").document(mapping_id)
-        mapping_data = mapping_ref.get().to_dict()
-
-        if not mapping_data:
-            logging.warning(f"Mapping document not found: {term_id}/{mapping_id}")
-            continue
-
-        codes = mapping_data.get("codes", [])
-        updated = False
-        for code_entry in codes:
-            if code_entry.get("code") == code_to_update and not code_entry.get("system"):
-                code_entry["system"] = proposed_system
-                updated = True
-
-        if updated:
-            try:
-                mapping_ref.update({"codes": codes})
-                updated_count += 1
-                logging.info(f"Updated mapping: {term_id}/{mapping_id} with system {proposed_system}")
-            except Exception as e:
-                logging.error(f"Failed to update mapping {term_id}/{mapping_id}: {e}")
-
-    logging.info(f"Updated {updated_count} mappings with proposed systems.")
-
-def main(project_id,database):
+    return update_systems(db, entries, should_update=lambda code_entry: not code_entry.get("system"))
+
+def main(project_id, database, snapshot=None, use_search_cache=True):
 
     _log_file = f"{LOGS_PATH}/{datetime.now().strftime('%Y%m%d_%H%M%S')}_{project_id}_{database}_system_remediation.log"
     issue_log_path = f"{LOGS_PATH}/{datetime.now().strftime('%Y%m%d_%H%M%S')}_{project_id}_{database}_missing_sys.csv"
+    plan_path = issue_log_path.replace(".csv", "_plan.json")
 
     # Set logging configs -log file created in data/logs
     set_logging_config(log_file = _log_file)
 
-    # Initiate Firestore client and setting the project_id
-    db = firestore.Client(project=project_id, database=database)
+    # Initiate Firestore client and setting the project_id, or read a local export
+    db = open_database(project_id, database, snapshot)
     
     # Find the mappings without systems, proposes systems where possible via the code prefix
     empty_systems = scan(db, issue_log_path)
@@ -213,7 +177,7 @@ def main(project_id,database):
         if entry.get("code") and entry.get("proposed_system") == 'UNKNOWN'
         })
     clean_codes = sorted(set(str(code).strip() for code in unique_codes if code))
-    code_map = batch_search_concepts(clean_codes, ontologies)
+    code_map = batch_search_concepts(clean_codes, ontologies, use_cache=use_search_cache)
     logging.info(f'maps: {code_map}')
     # Fill in missing proposed_systems from code_map
     for entry in empty_systems:
@@ -229,24 +193,37 @@ def main(project_id,database):
     # Writes a file to review the proposed mappings before running the update.
     write_file(issue_log_path, empty_systems, ["code","mapping_id"])
 
+    # Saves the updates with each document's update time, so they can be applied later
+    # without scanning again: python -m locutus_util.remediation_plan <plan>
+    plan = build_update_plan(empty_systems, project_id, database, only_missing=True)
+    save_plan(plan, plan_path)
+
+    if snapshot:
+        logging.info(f"Scanned the snapshot {snapshot}. Apply to the database with: python -m locutus_util.remediation_plan {plan_path} -p <project_id>")
+        return
+
     confirm = input("Update these mappings? [y/N]: ").strip().lower()
 
     if confirm == "y":
-        update_mapping_systems(db, empty_systems)
-        get_distinct_mapping_systems(project_id, database)
+        apply_plan(db, plan)
+        logging.info("Run get_distinct_mapping_systems.py to list the systems left in the db.")
 
     else:
-        logging.info("Update declined.")
+        logging.info(f"Update declined. Apply it later with: python -m locutus_util.remediation_plan {plan_path}")
 
 if __name__ == "__main__":
-    # TODO: Separate the jobs so you don't have to hit the db everytime you troubleshoot. For now, limit the scan to reduce cost.
+    # Use -s/--snapshot with a firestore_to_json export to troubleshoot without hitting the db.
     
     parser = argparse.ArgumentParser(description="Delete Terminology documents with slashes in their index.")
-    parser.add_argument('-p', '--project_id', required=True, help="GCP Project to edit")
+    parser.add_argument('-p', '--project_id', required=False, help="GCP Project to edit")
     parser.add_argument('-db', '--database', required=False, help="Database to edit. Will edit the projects default db if not set here.")
+    parser.add_argument('-s', '--snapshot', required=False, help="Scan a firestore_to_json export instead of the database. Nothing is written.")
+    parser.add_argument('--no-cache', action='store_true', help="Search every code again, without reading or writing the search cache.")
 
 
     args = parser.parse_args()
-    
+    if not (args.project_id or args.snapshot):
+        parser.error("one of -p/--project_id or -s/--snapshot is required")
 
-    main(project_id=args.project_id,database=args.database)
+    main(project_id=args.project_id, database=args.database, snapshot=args.snapshot,
+         use_search_cache=not args.no_cache)
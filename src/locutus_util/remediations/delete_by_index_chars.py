@@ -1,83 +1,160 @@
 #!/usr/bin/env python3
 import argparse
-from google.cloud import firestore
 import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from locutus_util.common import LOGS_PATH
-from locutus_util.helpers import (set_logging_config)
+from locutus_util import LOGS_PATH, SCAN_PARTITIONS, SCAN_MAX_WORKERS, DELETE_PAGE_SIZE
+from locutus_util.snapshot import open_database
+from locutus_util.remediation_plan import build_delete_plan, save_plan, apply_plan
+from locutus_util.helpers import (set_logging_config, write_file)
 
-def scan_for_invalid_subcollection_doc_ids(db):
+def has_slash(doc_id):
+    # NOTE: WILL CAPTURE ANY doc id with the character. Use a full match instead, if necessary.
+    return "/" in doc_id
+
+
+def is_terminology_subcollection_doc(doc_ref):
+    """True for documents in a subcollection directly under a 'Terminology' document."""
+    term_ref = doc_ref.parent.parent
+    return term_ref is not None and term_ref.parent.id == "Terminology" and term_ref.parent.parent is None
+
+
+def terminology_subcollection_ids(db, max_workers=SCAN_MAX_WORKERS):
+    """
+    Names of the subcollections under every Terminology document. Each document's
+    subcollections are listed, without reading any fields.
+    """
+    term_docs = db.collection("Terminology").list_documents(page_size=DELETE_PAGE_SIZE)
+    subcollection_ids = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for names in executor.map(lambda term_doc: [subcoll.id for subcoll in term_doc.collections()], term_docs):
+            subcollection_ids.update(names)
+    return sorted(subcollection_ids)
+
+
+def scan_partition(query, is_invalid):
+    """
+    Returns:
+        tuple: (list of (terminology_id, subcollection_id, document_id, reference, update_time), document keys read)
+    """
+    invalid_ids = []
+    keys_read = 0
+    for doc in query.stream():
+        keys_read += 1
+        doc_ref = doc.reference
+        if is_terminology_subcollection_doc(doc_ref) and is_invalid(doc.id):
+            invalid_ids.append((doc_ref.parent.parent.id, doc_ref.parent.id, doc.id, doc_ref, doc.update_time))
+    return invalid_ids, keys_read
+
+
+def scan_for_invalid_subcollection_doc_ids(db, subcollection_ids=None, is_invalid=has_slash,
+                                           partition_count=SCAN_PARTITIONS, max_workers=SCAN_MAX_WORKERS):
     """
     Scans all documents within subcollections under 'Terminology/*'
     for document IDs containing '/'.
-    Returns a list of (terminology_id, subcollection_id, document_id, full_path)
+
+    Each subcollection name is scanned as a collection group, split into partitions
+    that are scanned in parallel. Only the document keys are read.
+
+    A query only returns documents that exist. Unlike listing the subcollection's
+    documents, it does not return missing documents, ie. ids that only hold
+    subcollections of their own. Those are not found or deleted.
+
+    Args:
+        subcollection_ids (list): Subcollection names to scan. Defaults to the names
+            found under every Terminology document.
+        is_invalid (callable): doc id > True if the document should be deleted.
+
+    Returns a list of (terminology_id, subcollection_id, document_id, reference, update_time)
     """
-    invalid_ids = []
+    if subcollection_ids is None:
+        subcollection_ids = terminology_subcollection_ids(db, max_workers)
 
-    term_collection = db.collection('Terminology')
-
-    for term_doc in term_collection.list_documents():
-        term_id = term_doc.id
-        for subcoll in term_doc.collections():
-            subcoll_id = subcoll.id
-            for doc in subcoll.list_documents():
-                logging.info(f'Scaning Terminology, subcollection: {term_doc.id} / {subcoll.id} / {doc.id}')
-                # NOTE: WILL CAPTURE ANY doc id with the character. Use a full match instead, if necessary.
-                if "/" in doc.id:
-                    invalid_ids.append((
-                        term_id,
-                        subcoll_id,
-                        doc.id,
-                        doc.path
-                    ))
-                    logging.info(f"Invalid ids: {term_doc.id} / {subcoll.id} / {doc.id} - Path to delete: {doc.path}")
+    queries = [
+        partition.query().select(["__name__"])
+        for subcollection_id in subcollection_ids
+        for partition in db.collection_group(subcollection_id).get_partitions(partition_count)
+    ]
+    logging.info(f"Scanning the {', '.join(subcollection_ids)} collection groups in {len(queries)} partitions")
 
-    return invalid_ids
+    invalid_ids = []
+    keys_read = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for partition_invalid, partition_read in executor.map(lambda query: scan_partition(query, is_invalid), queries):
+            invalid_ids.extend(partition_invalid)
+            keys_read += partition_read
+
+    by_subcollection = Counter(invalid[1] for invalid in invalid_ids)
+    logging.info(
+        f"Read {keys_read} document keys. Found {len(invalid_ids)} invalid document ids"
+        + "".join(f"\n    {subcoll_id}: {count}" for subcoll_id, count in sorted(by_subcollection.items()))
+    )
 
+    return invalid_ids
 
-def delete_invalid_documents(invalid_ids, db):
-    
-    for term_id, subcoll_id, id, path in invalid_ids:
-        try:
-            doc_ref = db.document(path)
-            doc_ref.delete()
-            logging.info(f"Deleted invalid doc: {term_id} - {subcoll_id} - {id} - {path}")
-        except Exception as e:
-            logging.error(f"Failed to delete document {path}: {e}")
 
-def main(project_id,database):
+def main(project_id, database, snapshot=None, subcollection_ids=None,
+         partition_count=SCAN_PARTITIONS, max_workers=SCAN_MAX_WORKERS):
 
     _log_file = f"{LOGS_PATH}/{datetime.now().strftime('%Y%m%d_%H%M%S')}_{project_id}_remediation.log"
+    invalid_ids_path = f"{LOGS_PATH}/{datetime.now().strftime('%Y%m%d_%H%M%S')}_{project_id}_{database}_invalid_ids.csv"
+    plan_path = invalid_ids_path.replace(".csv", "_plan.json")
 
     # Set logging configs -log file created in data/logs
     set_logging_config(log_file = _log_file)
 
-    # Initiate Firestore client and setting the project_id
-    db = firestore.Client(project=project_id, database=database)
+    # Initiate Firestore client and setting the project_id, or read a local export
+    db = open_database(project_id, database, snapshot)
     
     logging.info("Scanning subcollections under 'Terminology' for bad document IDs...")
-    invalid_ids = scan_for_invalid_subcollection_doc_ids(db)
+    invalid_ids = scan_for_invalid_subcollection_doc_ids(db, subcollection_ids, partition_count=partition_count,
+                                                         max_workers=max_workers)
 
     if not invalid_ids:
         logging.info("No invalid document IDs found.")
         return
 
-    logging.info(f"\nFound {len(invalid_ids)} invalid document IDs. See: {LOGS_PATH}")
+    # Writes a file to review the documents before deleting them.
+    write_file(
+        invalid_ids_path,
+        [
+            {"terminology_id": term_id, "subcollection_id": subcoll_id, "document_id": id, "path": doc_ref.path}
+            for term_id, subcoll_id, id, doc_ref, update_time in invalid_ids
+        ],
+        ["path"],
+    )
+    logging.info(f"\nFound {len(invalid_ids)} invalid document IDs. See: {invalid_ids_path}")
+
+    # Saves the deletes with each document's update time, so they can be applied later
+    # without scanning again: python -m locutus_util.remediation_plan <plan>
+    plan = build_delete_plan(invalid_ids, project_id, database)
+    save_plan(plan, plan_path)
+
+    if snapshot:
+        logging.info(f"Scanned the snapshot {snapshot}. Apply to the database with: python -m locutus_util.remediation_plan {plan_path} -p <project_id>")
+        return
+
     confirm = input("Delete these documents? [y/N]: ").strip().lower()
 
     if confirm == "y":
-        delete_invalid_documents(invalid_ids, db)
+        apply_plan(db, plan)
     else:
-        logging.info("Deletion aborted.")
+        logging.info(f"Deletion aborted. Apply it later with: python -m locutus_util.remediation_plan {plan_path}")
 
 if __name__ == "__main__":
     
     parser = argparse.ArgumentParser(description="Delete Terminology documents with slashes in their index.")
-    parser.add_argument('-p', '--project_id', required=True, help="GCP Project to edit")
+    parser.add_argument('-p', '--project_id', required=False, help="GCP Project to edit")
     parser.add_argument('-db', '--database', required=False, help="Database to edit. Will edit the projects default db if not set here.")
-
+    parser.add_argument('-s', '--snapshot', required=False, help="Scan a firestore_to_json export instead of the database. Nothing is written.")
+    parser.add_argument('-c', '--subcollections', nargs='+', required=False, help="Terminology subcollections to scan. Defaults to every subcollection found under Terminology.")
+    parser.add_argument('--partitions', type=int, default=SCAN_PARTITIONS, help="Partitions each subcollection scan is split into")
+    parser.add_argument('-w', '--workers', type=int, default=SCAN_MAX_WORKERS, help="Partitions scanned at once")
 
     args = parser.parse_args()
-    
+    if not (args.project_id or args.snapshot):
+        parser.error("one of -p/--project_id or -s/--snapshot is required")
 
-    main(project_id=args.project_id,database=args.database)
+    main(project_id=args.project_id, database=args.database, snapshot=args.snapshot,
+         subcollection_ids=args.subcollections, partition_count=args.partitions, max_workers=args.workers)
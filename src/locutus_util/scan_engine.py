@@ -0,0 +1,358 @@
+"""
+Single-pass scan of the Terminology subcollections, shared by the analysis and
+remediation scripts.
+
+The engine walks Terminology once and passes every subcollection document to the
+registered visitors. Each visitor collects its own results:
+    MissingSystemVisitor   codes without a system(backfill_missing_systems)
+    SystemNormalizerVisitor codes with a short system name(normalize_systems)
+    DistinctSystemVisitor  codes per system(get_distinct_mapping_systems)
+    BadIdVisitor           document ids that need deleting(delete_by_index_chars)
+
+Only the subcollections a visitor asks for are read. Documents are streamed only
+for visitors that need their data. Otherwise ids are listed, which reads no
+fields. Terminology documents are scanned by a thread pool, and visitors are
+called in Terminology order from the calling thread, so they need no locking.
+
+Works with a firestore.Client or a snapshot.SnapshotClient.
+
+Run all visitors in one pass, writing each report to data/logs:
+`python -m locutus_util.scan_engine -p locutus-dev`
+`python -m locutus_util.scan_engine -s firestore_backup.json`
+"""
+
+import argparse
+import logging
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from locutus_util import LOGS_PATH, DELETE_PAGE_SIZE, SCAN_MAX_WORKERS
+
+# update_time is None when only ids were listed, or for snapshot documents
+ScannedDocument = namedtuple(
+    "ScannedDocument", ["term_id", "subcollection_id", "doc_id", "path", "update_time"], defaults=[None]
+)
+
+
+class ScanVisitor:
+    """
+    Base class for visitors.
+
+    Attributes:
+        subcollections (set): Subcollection ids to visit. None visits all of them.
+        needs_data (bool): If False, only document ids are read.
+    """
+
+    subcollections = {"mappings"}
+    needs_data = True
+
+    def visit(self, document, data):
+        """
+        Args:
+            document (ScannedDocument): Where the document is.
+            data (dict): The document's fields. None if no visitor needs data.
+        """
+        raise NotImplementedError
+
+    def finish(self):
+        """Called once after the scan, before the summary."""
+
+    def summary(self):
+        return ""
+
+
+class SystemEntryVisitor(ScanVisitor):
+    """
+    Base class for visitors that collect one entry per code with a system to replace.
+    The proposed systems are filled in once, for all entries, when the scan finishes.
+
+    Args:
+        propose_systems (callable): List of proposal_key values > list of proposed systems.
+    """
+
+    def __init__(self, propose_systems):
+        self.propose_systems = propose_systems
+        self.entries = []
+        self._proposal_keys = []
+
+    def matches(self, system):
+        """True if a code with this system should be replaced."""
+        raise NotImplementedError
+
+    def proposal_key(self, code_entry):
+        """The value the proposed system is based on."""
+        raise NotImplementedError
+
+    def visit(self, document, data):
+        for code_entry in data.get("codes", []):
+            system = code_entry.get("system")
+            if self.matches(system):
+                self.entries.append({
+                    "terminology_id": document.term_id,
+                    "mapping_id": document.doc_id,
+                    "code": code_entry.get("code"),
+                    "display": code_entry.get("display"),
+                    "system": system,
+                    "proposed_system": None,
+                    "update_time": document.update_time,
+                })
+                self._proposal_keys.append(self.proposal_key(code_entry))
+
+    def finish(self):
+        proposed = self.propose_systems(self._proposal_keys)
+        for entry, proposed_system in zip(self.entries, proposed):
+            entry["proposed_system"] = proposed_system
+        self._proposal_keys = []
+
+    def unknown(self):
+        return sum(1 for entry in self.entries if entry["proposed_system"] == "UNKNOWN")
+
+
+class MissingSystemVisitor(SystemEntryVisitor):
+    """
+    Codes with no system, an empty system or 'UK Biobank'. Systems are proposed from the code.
+
+    Args:
+        propose_systems (callable): codes > proposed systems.
+    """
+
+    MISSING = (None, "", "UK Biobank")
+
+    def matches(self, system):
+        return system in self.MISSING
+
+    def proposal_key(self, code_entry):
+        return code_entry.get("code")
+
+    def summary(self):
+        return f"Total missing system entries: {len(self.entries)}, {self.unknown()} without a proposed system"
+
+
+class SystemNormalizerVisitor(SystemEntryVisitor):
+    """
+    Codes whose system is a short name(ex. 'LOINC') instead of a system url.
+
+    Args:
+        systems (iterable): Short names to replace.
+        propose_systems (callable): short names > proposed systems.
+    """
+
+    def __init__(self, systems, propose_systems):
+        super().__init__(propose_systems)
+        self.systems = frozenset(systems)
+
+    def matches(self, system):
+        return system in self.systems
+
+    def proposal_key(self, code_entry):
+        return code_entry.get("system")
+
+    def summary(self):
+        short_names = Counter(entry["system"] for entry in self.entries)
+        return (
+            f"Total short system name entries: {len(self.entries)}, {self.unknown()} without a known system url. "
+            + ", ".join(f"{name}: {count}" for name, count in short_names.most_common())
+        )
+
+
+class DistinctSystemVisitor(ScanVisitor):
+    """Number of codes per system. None counts the codes without a system."""
+
+    def __init__(self):
+        self.system_counts = Counter()
+
+    def visit(self, document, data):
+        for code_entry in data.get("codes") or []:
+            self.system_counts[code_entry.get("system")] += 1
+
+    def summary(self):
+        return (
+            f"Found {len(self.system_counts)} distinct systems, and "
+            f"{self.system_counts.get(None, 0)} codes without a system."
+        )
+
+
+class BadIdVisitor(ScanVisitor):
+    """
+    Documents in any Terminology subcollection with an invalid id.
+
+    Args:
+        is_invalid (callable): doc id > True if the document should be deleted.
+            Defaults to ids containing '/'.
+    """
+
+    subcollections = None
+    needs_data = False
+
+    def __init__(self, is_invalid=lambda doc_id: "/" in doc_id):
+        self.is_invalid = is_invalid
+        self.invalid_ids = []
+
+    def visit(self, document, data):
+        if self.is_invalid(document.doc_id):
+            self.invalid_ids.append((document.term_id, document.subcollection_id, document.doc_id, document.path))
+
+    def summary(self):
+        return f"Found {len(self.invalid_ids)} invalid document ids"
+
+
+class TerminologyScanner:
+    """
+    Walk the Terminology subcollections once, for every visitor.
+
+    Args:
+        db: firestore.Client or snapshot.SnapshotClient.
+        visitors (list): ScanVisitor instances.
+        max_workers (int): Terminology documents scanned at once.
+        page_size (int): Page size when listing document ids.
+    """
+
+    def __init__(self, db, visitors, max_workers=SCAN_MAX_WORKERS, page_size=DELETE_PAGE_SIZE):
+        self.db = db
+        self.visitors = list(visitors)
+        self.max_workers = max_workers
+        self.page_size = page_size
+
+        # Read accounting
+        self.terminologies = 0
+        self.documents_read = 0  # Streamed with their fields
+        self.ids_listed = 0  # Listed without fields
+        self.subcollection_listings = 0  # collections() calls
+
+    def _wanted(self, subcollection_id):
+        """(visitors of the subcollection, True if any of them needs data)"""
+        visitors = [
+            visitor for visitor in self.visitors
+            if visitor.subcollections is None or subcollection_id in visitor.subcollections
+        ]
+        return visitors, any(visitor.needs_data for visitor in visitors)
+
+    def _scan_terminology(self, term_doc):
+        """Read one Terminology document's subcollections. Runs on a worker thread."""
+        if any(visitor.subcollections is None for visitor in self.visitors):
+            subcollections = list(term_doc.collections())
+            listings = 1
+        else:
+            names = set().union(*(visitor.subcollections for visitor in self.visitors))
+            subcollections = [term_doc.collection(name) for name in sorted(names)]
+            listings = 0
+
+        found = []
+        documents_read = 0
+        ids_listed = 0
+        for subcoll in subcollections:
+            visitors, needs_data = self._wanted(subcoll.id)
+            if not visitors:
+                continue
+            if needs_data:
+                for doc in subcoll.stream():
+                    documents_read += 1
+                    found.append((subcoll.id, doc.id, doc.reference.path, doc.update_time, doc.to_dict() or {}))
+            else:
+                for doc in subcoll.list_documents(page_size=self.page_size):
+                    ids_listed += 1
+                    found.append((subcoll.id, doc.id, doc.path, None, None))
+
+        return term_doc.id, found, (documents_read, ids_listed, listings)
+
+    def run(self):
+        """
+        Scan, and call every visitor for each document.
+
+        Returns:
+            list: The visitors, with their results.
+        """
+        start = time.perf_counter()
+        term_docs = self.db.collection("Terminology").list_documents(page_size=self.page_size)
+
+        # Bounded batches, so only a few Terminology documents' results are held at once
+        batch_size = max(1, self.max_workers * 4)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            batch = []
+            for term_doc in term_docs:
+                batch.append(term_doc)
+                if len(batch) >= batch_size:
+                    self._visit_batch(executor, batch)
+                    batch = []
+            if batch:
+                self._visit_batch(executor, batch)
+
+        logging.info(
+            f"Scanned {self.terminologies} Terminologies in {time.perf_counter() - start:.1f}s. "
+            f"Read {self.documents_read} documents, listed {self.ids_listed} ids and "
+            f"{self.subcollection_listings} subcollection lists."
+        )
+        for visitor in self.visitors:
+            visitor.finish()
+            if visitor.summary():
+                logging.info(f"{type(visitor).__name__}: {visitor.summary()}")
+        return self.visitors
+
+    def _visit_batch(self, executor, batch):
+        for term_id, found, (documents_read, ids_listed, listings) in executor.map(
+            self._scan_terminology, batch
+        ):
+            self.terminologies += 1
+            self.documents_read += documents_read
+            self.ids_listed += ids_listed
+            self.subcollection_listings += listings
+
+            for subcollection_id, doc_id, path, update_time, data in found:
+                document = ScannedDocument(term_id, subcollection_id, doc_id, path, update_time)
+                for visitor in self.visitors:
+                    if visitor.subcollections is None or subcollection_id in visitor.subcollections:
+                        visitor.visit(document, data)
+
+
+def scan_terminology(db, visitors, max_workers=SCAN_MAX_WORKERS):
+    """Run the visitors over Terminology in one pass. Returns the visitors."""
+    return TerminologyScanner(db, visitors, max_workers=max_workers).run()
+
+
+def main(project_id=None, database=None, snapshot=None, max_workers=SCAN_MAX_WORKERS):
+    """Run every remediation and analysis scan in one pass, and write their reports."""
+    from locutus_util.helpers import write_file
+    from locutus_util.reference_data import get_ontology_api_systems
+    from locutus_util.remediations import backfill_missing_systems
+    from locutus_util.snapshot import open_database
+    from locutus_util.system_normalizer import SHORT_SYSTEM_NAMES, get_normalizer
+
+    prefix = f"{LOGS_PATH}/{datetime.now().strftime('%Y%m%d_%H%M%S')}_{project_id or 'snapshot'}_{database}"
+    LOGS_PATH.mkdir(parents=True, exist_ok=True)
+
+    db = open_database(project_id, database, snapshot)
+    ontology_lookup = get_ontology_api_systems()
+
+    missing = MissingSystemVisitor(backfill_missing_systems.code_system_proposer(ontology_lookup))
+    normalize = SystemNormalizerVisitor(SHORT_SYSTEM_NAMES, get_normalizer(ontology_lookup).normalize_many)
+    distinct = DistinctSystemVisitor()
+    bad_ids = BadIdVisitor()
+    scan_terminology(db, [missing, normalize, distinct, bad_ids], max_workers)
+
+    write_file(f"{prefix}_missing_sys.csv", missing.entries, ["code", "mapping_id"])
+    write_file(f"{prefix}_normalize_sys.csv", normalize.entries, ["code", "mapping_id"])
+    write_file(
+        f"{prefix}_existing_systems.csv",
+        [{"system": system, "count": count} for system, count in distinct.system_counts.items() if system is not None],
+        ["system"],
+    )
+    write_file(
+        f"{prefix}_invalid_ids.csv",
+        [dict(zip(ScannedDocument._fields, invalid)) for invalid in bad_ids.invalid_ids],
+        ["path"],
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan Terminology once for every remediation report.")
+    parser.add_argument('-p', '--project_id', required=False, help="GCP Project to scan")
+    parser.add_argument('-db', '--database', required=False, help="Database to scan. Will scan the projects default db if not set here.")
+    parser.add_argument('-s', '--snapshot', required=False, help="Scan a firestore_to_json export instead of the database.")
+    parser.add_argument('-w', '--workers', type=int, default=SCAN_MAX_WORKERS, help="Terminology documents scanned at once")
+
+    args = parser.parse_args()
+    if not (args.project_id or args.snapshot):
+        parser.error("one of -p/--project_id or -s/--snapshot is required")
+
+    main(args.project_id, args.database, args.snapshot, args.workers)
@@ -0,0 +1,116 @@
+"""
+Disk-backed cache of concept search results for the remediations.
+
+backfill_missing_systems searches each code without a known system. The system of
+the first hit(or UNKNOWN) is kept in a SQLite database in data/cache, keyed by the
+search scope: the ontologies, the apis and the start index. A re-run only searches
+the codes it has not seen in that scope. Failed searches are not cached, and UNKNOWN
+results are searched again once they are older than SEARCH_CACHE_TTL, as the apis
+may have the concept by then.
+
+Usage:
+    from locutus_util.search_cache import get_search_cache, search_scope
+    cache = get_search_cache()
+    scope = search_scope(["SNOMEDCT_US"], ["umls"])
+    found = cache.get_many(scope, codes)
+    cache.put_many(scope, {"code": "system"})
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from locutus_util import logger, SEARCH_CACHE_PATH, SEARCH_CACHE_TTL
+from locutus_util.system_inference import UNKNOWN_SYSTEM
+
+
+def search_scope(ontologies, search_api_list, start_index=0):
+    """Cache key of a search's parameters. The order of the lists does not matter."""
+    return json.dumps(
+        {"ontologies": sorted(ontologies), "apis": sorted(search_api_list), "start_index": start_index},
+        sort_keys=True,
+    )
+
+
+class SearchResultCache:
+    """
+    SQLite store of concept > system, per search scope.
+
+    Args:
+        path (Path): The SQLite database file.
+        unknown_ttl (float): Seconds an UNKNOWN result is used. Found systems do not expire.
+    """
+
+    def __init__(self, path=SEARCH_CACHE_PATH, unknown_ttl=SEARCH_CACHE_TTL):
+        self.path = path
+        self.unknown_ttl = unknown_ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                scope TEXT NOT NULL,
+                concept TEXT NOT NULL,
+                system TEXT NOT NULL,
+                searched_at REAL NOT NULL,
+                PRIMARY KEY (scope, concept)
+            )"""
+        )
+        self._connection.commit()
+
+    def get_many(self, scope, concepts):
+        """
+        Returns:
+            dict: concept > system, for the concepts that are cached and not expired.
+        """
+        concepts = list(concepts)
+        found = {}
+        expired_before = time.time() - self.unknown_ttl
+        with self._lock:
+            # Stay under SQLite's limit on bound parameters
+            for start in range(0, len(concepts), 500):
+                chunk = concepts[start:start + 500]
+                rows = self._connection.execute(
+                    f"SELECT concept, system FROM results WHERE scope = ? AND concept IN ({','.join('?' * len(chunk))}) "
+                    "AND (system != ? OR searched_at >= ?)",
+                    [scope, *chunk, UNKNOWN_SYSTEM, expired_before],
+                ).fetchall()
+                found.update(rows)
+            self.hits += len(found)
+            self.misses += len(set(concepts)) - len(found)
+        return found
+
+    def put_many(self, scope, results):
+        """
+        Args:
+            results (dict): concept > system
+        """
+        searched_at = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                [(scope, concept, system, searched_at) for concept, system in results.items()],
+            )
+            self._connection.commit()
+
+    def log_stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0
+        logger.info(f"Search cache: {self.hits} hits, {self.misses} searched ({hit_rate:.0f}% hit rate)")
+
+
+_search_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_search_cache():
+    """Return the default search cache, creating it on first use."""
+    global _search_cache
+    if _search_cache is None:
+        with _cache_lock:
+            if _search_cache is None:
+                _search_cache = SearchResultCache()
+    return _search_cache
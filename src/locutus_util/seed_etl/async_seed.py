@@ -0,0 +1,158 @@
+"""
+asyncio seed mode for seed_data_etl. Run with `seed_data --async`.
+
+Every configured file is formatted before any request is sent. The Terminology
+PUTs (seed) or code DELETEs (delete) for all files are then sent at once, with at
+most `max_in_flight` requests open. 5xx and 429 responses are retried with
+exponential backoff. A latency summary is logged at the end.
+
+Requests are sent by the shared, pooled Session in locutus_util.http_client from
+worker threads, so no async HTTP package is needed.
+"""
+
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from locutus_util import logger, HTTP_MAX_WORKERS, HTTP_MAX_RETRIES, HTTP_BACKOFF
+from locutus_util.http_client import timed_request, get_session, log_latency_summary
+
+HEADERS = {"Content-Type": "application/json"}
+DELETE_BODY = {"editor": "locutus_utils"}
+
+
+def is_retryable(status_code):
+    return status_code == 429 or status_code >= 500
+
+
+def retry_delay(attempt, response, backoff):
+    """Seconds to wait before the next attempt. Honors a numeric Retry-After header."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return int(retry_after)
+    return backoff * 2 ** attempt * (1 + random.random() / 2)
+
+
+def plan_requests(base_url, request_bodies, action):
+    """
+    Build the requests for every formatted file.
+
+    Args:
+        request_bodies (dict): format_for_loc output, keyed by (seed_config.yaml entry, file path).
+        action (str): 'seed' or 'delete'
+
+    Returns:
+        list: (file_name, terminology key, method, endpoint, body)
+    """
+    planned = []
+    for (file_name, filepath), terminology in request_bodies.items():
+        for keys, values in terminology.items():
+            t_id = values.get("id")
+            if action == "seed":
+                endpoint = f"{base_url}/api/Terminology/{t_id}"
+                planned.append((file_name, keys, "PUT", endpoint, values))
+
+            if action == "delete":
+                for code in values.get("codes"):
+                    endpoint = f"{base_url}/api/Terminology/{t_id}/code/{code.get('code')}"
+                    planned.append((file_name, keys, "DELETE", endpoint, DELETE_BODY))
+    return planned
+
+
+async def send(semaphore, method, endpoint, body, max_retries, backoff):
+    """
+    Send one request, retrying 5xx/429 responses and connection errors.
+
+    Returns:
+        tuple: (Response or None, latency of each attempt in seconds)
+    """
+    latencies = []
+    for attempt in range(max_retries + 1):
+        res = None
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                res, _ = await asyncio.to_thread(
+                    timed_request, method, endpoint, json=body, headers=HEADERS
+                )
+                if not is_retryable(res.status_code):
+                    latencies.append(time.perf_counter() - start)
+                    return res, latencies
+                logger.warning(f"{res.status_code} - '{endpoint}' (attempt {attempt + 1})")
+
+            except Exception as e:
+                logger.warning(f"Error sending {method} '{endpoint}' (attempt {attempt + 1}): {e}")
+
+            latencies.append(time.perf_counter() - start)
+
+        # Back off outside the semaphore so other requests can use the slot
+        if attempt < max_retries:
+            await asyncio.sleep(retry_delay(attempt, res, backoff))
+
+    return res, latencies
+
+
+async def send_all(planned, max_in_flight, max_retries, backoff):
+    loop = asyncio.get_running_loop()
+    # One worker thread per in-flight request
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max_in_flight))
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    return await asyncio.gather(*[
+        send(semaphore, method, endpoint, body, max_retries, backoff)
+        for _, _, method, endpoint, body in planned
+    ])
+
+
+def seed_async(base_url, request_bodies, action, max_in_flight=HTTP_MAX_WORKERS,
+               max_retries=HTTP_MAX_RETRIES, backoff=HTTP_BACKOFF):
+    """
+    Send the requests for every formatted file concurrently.
+
+    Args:
+        base_url (str): Locutus base url.
+        request_bodies (dict): format_for_loc output, keyed by (seed_config.yaml entry, file path).
+        action (str): 'seed' or 'delete'
+        max_in_flight (int): Maximum number of requests open at once.
+        max_retries (int): Retries per request for 5xx/429 responses.
+        backoff (float): Seconds before the first retry, doubled on each retry.
+
+    Returns:
+        dict: {file_name: {terminology key: {"status_code", "response"}}}. For
+        deletes, the result of the last code of each Terminology is kept.
+    """
+    planned = plan_requests(base_url, request_bodies, action)
+    logger.info(f"Sending {len(planned)} requests, {max_in_flight} at a time.")
+
+    # Size the connection pool before the first request creates the Session
+    get_session(pool_size=max_in_flight)
+
+    start = time.perf_counter()
+    results = asyncio.run(send_all(planned, max_in_flight, max_retries, backoff))
+    elapsed = time.perf_counter() - start
+
+    response = {}
+    final_latencies = []
+    failed = 0
+    retried = 0
+    for (file_name, keys, method, endpoint, _), (res, latencies) in zip(planned, results):
+        retried += len(latencies) - 1
+        if res is None or res.status_code != 200:
+            failed += 1
+            status = res.status_code if res is not None else "no response"
+            logger.error(f"Failed {method} '{endpoint}': {status} - {res.text if res is not None else ''}")
+        else:
+            logger.info(f"{res.status_code} - '{endpoint}' ({latencies[-1] * 1000:.0f} ms)")
+
+        if res is not None:
+            response.setdefault(file_name, {})[keys] = {
+                "status_code": res.status_code,
+                "response": res.text,
+            }
+        final_latencies.append(latencies[-1])
+
+    logger.info(
+        f"Sent {len(planned)} requests in {elapsed:.1f}s. {failed} failed, {retried} retries."
+    )
+    log_latency_summary(f"{action} (final attempts)", final_latencies)
+    return response
@@ -0,0 +1,99 @@
+"""
+Transitive closure (ancestor/descendant) tables for seeded terminologies.
+
+refresh_data writes `{normalized file}_closure.csv` next to each normalized csv
+built from an ontology. Every row pairs a code with one of its ancestors, and the
+shortest number of subsumption steps between them. Each code is also paired with
+itself at depth 0.
+
+Load a closure with `load_closure` to answer "is X a descendant of Y" in O(1):
+    closure = load_closure(SEED_ETL_DIR / "ftd-acr-enum-relationship-code_closure.csv")
+    is_descendant(closure, "KIN_004", "KIN_002")
+"""
+
+import csv
+from collections import defaultdict, deque
+from pathlib import Path
+
+CLOSURE_COLUMNS = ["code", "ancestor", "depth"]
+
+
+def closure_path(normalized_file):
+    normalized_file = Path(normalized_file)
+    return normalized_file.with_name(f"{normalized_file.stem}_closure.csv")
+
+
+def transitive_closure(edges, nodes=()):
+    """
+    Compute every ancestor of every node.
+
+    Args:
+        edges (iterable): (child, parent) pairs.
+        nodes (iterable): Extra nodes to include, ex. codes without a parent.
+
+    Returns:
+        dict: node > {ancestor: shortest depth}. Each node is its own ancestor at depth 0.
+    """
+    parents = defaultdict(set)
+    all_nodes = set(nodes)
+    for child, parent in edges:
+        parents[child].add(parent)
+        all_nodes.update((child, parent))
+
+    closure = {}
+    for node in all_nodes:
+        # Breadth first, so the first visit to an ancestor is the shortest path.
+        # Also stops on cycles, which equivalent entities can create.
+        depths = {node: 0}
+        queue = deque([node])
+        while queue:
+            current = queue.popleft()
+            for parent in parents[current]:
+                if parent not in depths:
+                    depths[parent] = depths[current] + 1
+                    queue.append(parent)
+        closure[node] = depths
+
+    return closure
+
+
+def write_closure_csv(closure, output_file, code_of=lambda node: node, include=None):
+    """
+    Write a closure as code,ancestor,depth rows, sorted by code then depth.
+
+    Args:
+        code_of (callable): Converts a node(ex. an IRI) to the code written.
+        include (set): Only write rows where both nodes are in this set.
+    """
+    rows = [
+        (code_of(node), code_of(ancestor), depth)
+        for node, ancestors in closure.items()
+        if include is None or node in include
+        for ancestor, depth in ancestors.items()
+        if include is None or ancestor in include
+    ]
+    rows.sort(key=lambda row: (row[0], row[2], row[1]))
+
+    with open(output_file, "w", newline="") as closure_file:
+        writer = csv.writer(closure_file)
+        writer.writerow(CLOSURE_COLUMNS)
+        writer.writerows(rows)
+
+    return len(rows)
+
+
+def load_closure(closure_file):
+    """
+    Returns:
+        dict: code > {ancestor: depth}
+    """
+    closure = defaultdict(dict)
+    with open(closure_file, newline="") as closure_csv:
+        for row in csv.DictReader(closure_csv):
+            closure[row["code"]][row["ancestor"]] = int(row["depth"])
+    return dict(closure)
+
+
+def is_descendant(closure, code, ancestor):
+    """True if `code` is `ancestor`, or is subsumed by it at any depth."""
+    return ancestor in closure.get(code, ())
@@ -0,0 +1,157 @@
+"""
+Streaming parser for 'OWL 2 Functional Syntax' files.
+
+Reads the file a line at a time and yields one row per entity (object property or
+class). Labels and skos definitions are joined to their entity by IRI, so an
+entity without a definition gets an empty description rather than another
+entity's.
+
+Files written by the OWL API group each entity's axioms under a comment header
+such as `# Object Property: <iri> (name)`. A row is yielded as soon as the next
+header starts, so only the current entity is held in memory. Annotations for
+entities outside their header block are held until the end of the file.
+
+Named `SubClassOf` and `SubObjectPropertyOf` axioms are collected as
+(child iri, parent iri) pairs while iterating, for building hierarchy closures.
+Axioms on anonymous expressions (ex. property chains) are skipped.
+
+Use case: https://raw.githubusercontent.com/ga4gh/pedigree_family_history_terminology/refs/heads/main/src/main/resources/kin.owl
+"""
+
+import re
+
+OBJECT_PROPERTY = "ObjectProperty"
+CLASS = "Class"
+
+LABEL_PROPERTIES = {"rdfs:label", "<http://www.w3.org/2000/01/rdf-schema#label>"}
+DEFINITION_PROPERTIES = {"skos:definition", "<http://www.w3.org/2004/02/skos/core#definition>"}
+
+HEADER_PATTERN = re.compile(r"^# (Object Property|Class): <([^>]+)> \((.*)\)\s*$")
+DECLARATION_PATTERN = re.compile(r"^Declaration\((ObjectProperty|Class)\(<([^>]+)>\)\)")
+ANNOTATION_PATTERN = re.compile(
+    r'^AnnotationAssertion\((\S+) <([^>]+)> "((?:[^"\\]|\\.)*)"', re.DOTALL
+)
+SUBSUMPTION_PATTERN = re.compile(r"^(?:SubClassOf|SubObjectPropertyOf)\(<([^>]+)> <([^>]+)>\)")
+HEADER_TYPES = {"Object Property": OBJECT_PROPERTY, "Class": CLASS}
+
+
+def code_from_iri(iri):
+    """http://purl.org/ga4gh/kin.owl#KIN_001 > KIN_001"""
+    return re.split(r"[#/]", iri)[-1]
+
+
+def unescape(literal):
+    return literal.replace('\\"', '"').replace("\\\\", "\\")
+
+
+def has_open_literal(text):
+    """True if `text` ends inside a quoted literal."""
+    quotes = len(re.findall(r'(?<!\\)(?:\\\\)*"', text))
+    return quotes % 2 == 1
+
+
+class OWLFunctionalParser:
+    """
+    Iterate over the entities of an OWL 2 Functional Syntax file.
+
+    Args:
+        lines (iterable): Lines of the file, ex. an open file object.
+        entity_types (iterable): Entity types to yield. Defaults to all.
+
+    Yields:
+        dict: code, iri, entity_type, display, label, description
+            display is the name from the comment header, or the label.
+    """
+
+    def __init__(self, lines, entity_types=(OBJECT_PROPERTY, CLASS)):
+        self.lines = lines
+        self.entity_types = set(entity_types)
+        self.declared = {}  # iri > entity type
+        self.subsumptions = []  # (child iri, parent iri)
+        self.emitted = set()  # iris of the yielded entities
+        self._pending = {}  # iri > entity, not yet yielded
+
+    def __iter__(self):
+        current = None
+
+        for statement in self._statements():
+            header = HEADER_PATTERN.match(statement)
+            if header:
+                if current is not None:
+                    yield from self._emit(current)
+                entity_type, iri, name = header.groups()
+                current = self._entity(iri)
+                current["entity_type"] = HEADER_TYPES[entity_type]
+                current["display"] = name
+                continue
+
+            declaration = DECLARATION_PATTERN.match(statement)
+            if declaration:
+                entity_type, iri = declaration.groups()
+                self.declared[iri] = entity_type
+                continue
+
+            subsumption = SUBSUMPTION_PATTERN.match(statement)
+            if subsumption:
+                self.subsumptions.append(subsumption.groups())
+                continue
+
+            annotation = ANNOTATION_PATTERN.match(statement)
+            if annotation:
+                prop, iri, literal = annotation.groups()
+                entity = current if current is not None and current["iri"] == iri else self._entity(iri)
+                if prop in LABEL_PROPERTIES:
+                    entity["label"] = unescape(literal)
+                elif prop in DEFINITION_PROPERTIES:
+                    entity["description"] = unescape(literal)
+
+        if current is not None:
+            yield from self._emit(current)
+
+        # Entities that were declared or annotated outside of a header block
+        for iri in list(self._pending):
+            yield from self._emit(self._pending[iri])
+
+    def _entity(self, iri):
+        """The entity being built for an IRI, created on first reference."""
+        if iri not in self._pending:
+            self._pending[iri] = {
+                "code": code_from_iri(iri),
+                "iri": iri,
+                "entity_type": None,
+                "display": "",
+                "label": "",
+                "description": "",
+            }
+        return self._pending[iri]
+
+    def _emit(self, entity):
+        iri = entity["iri"]
+        self._pending.pop(iri, None)
+        if iri in self.emitted:
+            return
+
+        entity["entity_type"] = entity["entity_type"] or self.declared.get(iri)
+        if entity["entity_type"] is None:
+            # Annotated, but never declared. Might still be declared later.
+            self._pending[iri] = entity
+            return
+        if entity["entity_type"] not in self.entity_types:
+            return
+
+        self.emitted.add(iri)
+        entity["display"] = entity["display"] or entity["label"]
+        yield entity
+
+    def _statements(self):
+        """Yield stripped lines, joining lines that continue a quoted literal."""
+        buffer = ""
+        for line in self.lines:
+            buffer = f"{buffer}\n{line.rstrip(chr(10))}" if buffer else line.strip()
+            if has_open_literal(buffer):
+                continue
+            if buffer:
+                yield buffer
+            buffer = ""
+        if buffer:
+            yield buffer
@@ -7,7 +7,9 @@ Run examples
 """
 
 import pandas as pd
-from locutus_util.helpers import read_file, parse_owl2_data
+from locutus_util.helpers import read_file
+from locutus_util.seed_etl.owl_parser import OWLFunctionalParser, code_from_iri
+from locutus_util.seed_etl.hierarchy import transitive_closure, write_closure_csv, closure_path
 from locutus_util import SEED_ETL_DIR, logger
 
 FINAL_SCHEMA = [
@@ -19,11 +21,16 @@ def transform_csv(source_data, output_file, mapping_config):
     """
     Transforms a source data into the desired final schema based on the given mapping configuration(seed_config.yaml).
     Saves the data in the data dir as csv.
+
+    source_data can be a DataFrame, or any iterable of row dicts(ex. a streaming
+    OWLFunctionalParser).
     """
     try:
+        if isinstance(source_data, pd.DataFrame):
+            source_data = source_data.to_dict(orient="records")
 
         transformed_rows = []
-        for _, row in source_data.iterrows():
+        for row in source_data:
             transformed_row = {}
             for final_column in FINAL_SCHEMA:
                 if final_column in mapping_config:
@@ -90,12 +97,23 @@ def process_files(file_metadata, input_dir, seeding_input_dir):
         for file in norm_fns:
             output_file = seeding_input_dir / file
 
-            source_data, file_ext = read_file(input_file, source_data.get('delimeter'))
-
-            if file_ext == '.owl':
-                source_data = parse_owl2_data(source_data)
-            
-            transform_csv(source_data, output_file, file_metadata.get('mappings'))
+            if str(input_file).lower().endswith('.owl'):
+                # Stream the ontology into the transform, one entity at a time
+                entity_types = source_data.get('entity_types', ['ObjectProperty'])
+                with open(input_file, "r", encoding="utf-8") as owl_file:
+                    rows = OWLFunctionalParser(owl_file, entity_types=entity_types)
+                    transform_csv(rows, output_file, file_metadata.get('mappings'))
+
+                # Ancestor/descendant table of the seeded codes, next to the normalized csv
+                closure = transitive_closure(rows.subsumptions, nodes=rows.emitted)
+                row_count = write_closure_csv(
+                    closure, closure_path(output_file), code_of=code_from_iri, include=rows.emitted
+                )
+                logger.debug(f"Closure with {row_count} rows saved to {closure_path(output_file)}")
+                continue
+
+            data, file_ext = read_file(input_file, source_data.get('delimeter'))
+            transform_csv(data, output_file, file_metadata.get('mappings'))
     except:
         logger.error(f"Could not process {file}")
 
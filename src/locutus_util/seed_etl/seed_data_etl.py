@@ -7,14 +7,15 @@ Run examples
 Options: 
 -e change the baseurl from localhost to another url
 -a change the default action from seeding the db to deleting from the db.
+-c change the number of requests sent to locutus at once.
+--async send the requests for every configured file at once, retrying 5xx/429 responses.
 
 """
 
 import argparse
 import csv
-import requests
 from locutus_util.helpers import read_file, delete_codes, save_terminology
-from locutus_util import SEED_ETL_DIR, logger, CONFIGS, CONFIG_FILE_PATH, resolve_environment
+from locutus_util import SEED_ETL_DIR, logger, CONFIG_FILE_PATH, resolve_environment, HTTP_MAX_WORKERS, HTTP_MAX_RETRIES
 
 def format_for_loc(file_path):
     terminology_data = {}
@@ -42,6 +43,28 @@ def format_for_loc(file_path):
             )
     return terminology_data
 
+def files_for_action(config, action):
+    """
+    Yields (file_name, filepath) for each seed_config.yaml entry the action runs on.
+    """
+    for file_name, file_config in config.items():
+        if file_config.get("remove_codes", False) != True and file_config.get("seed_db", False) != True:
+            logger.info(f"SKIPPING {file_name}. Not configured for action '{action}'.")
+            continue
+
+        if action == 'seed' and file_config.get('seed_db', False) != True:
+            continue
+
+        if action == 'delete' and file_config.get('remove_codes') is not True:
+            continue
+
+        fnames = file_config.get("normalized_data").get('name')
+
+        for file in fnames:
+            logger.debug(f"Reading config settings for file: {file_name}")
+            filepath = SEED_ETL_DIR / file
+            yield file_name, filepath
+
 def main():    
 
     parser = argparse.ArgumentParser(description="Load CSV data into Firestore.")
@@ -57,6 +80,25 @@ def main():
         help="Choose whether to seed the db with a Terminology, or delete codes from a db Terminology",
         choices=['seed','delete']
     )
+    parser.add_argument(
+        '-c',
+        '--concurrency',
+        type=int,
+        default=HTTP_MAX_WORKERS,
+        help=f"Maximum number of requests to locutus in flight at once. Default {HTTP_MAX_WORKERS}",
+    )
+    parser.add_argument(
+        '--async',
+        dest='use_async',
+        action='store_true',
+        help="Format every configured file first, then send all requests concurrently with asyncio. Retries 5xx/429 responses.",
+    )
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=HTTP_MAX_RETRIES,
+        help=f"Retries per request in --async mode. Default {HTTP_MAX_RETRIES}",
+    )
     args = parser.parse_args()
 
     resolved_uri = resolve_environment(args.locutus_url)
@@ -67,36 +109,27 @@ def main():
     config_file = SEED_ETL_DIR / "seed_config.yaml"
     config, file_ext = read_file(config_file)
 
-    for file_name, file_config in config.items():
-        if file_config.get("remove_codes", False) != True and file_config.get("remove_codes", False)  != True:
-            logger.info(f"SKIPPING {file_name}. Not configured for action '{args.action}'.")
-            continue
+    if args.use_async:
+        from locutus_util.seed_etl.async_seed import seed_async
 
-        if file_config.get('seed_db', False) == True: 
-            fnames = file_config.get("normalized_data").get('name')
+        request_bodies = {
+            (file_name, filepath): format_for_loc(filepath)
+            for file_name, filepath in files_for_action(config, args.action)
+        }
+        seed_async(resolved_uri, request_bodies, args.action,
+                   max_in_flight=args.concurrency, max_retries=args.retries)
 
-            for file in fnames:
-                logger.debug(f"Reading config settings for file: {file_name}")
-                filepath = SEED_ETL_DIR / file
+    else:
+        for file_name, filepath in files_for_action(config, args.action):
+            request_body = format_for_loc(filepath)
 
             if args.action == 'seed':
-                request_body = format_for_loc(filepath)
                 logger.debug(f'Saving Terminology {file_name}')
-                save_terminology(resolved_uri, request_body)
-
-        if file_config.get("remove_codes", False) == True:
-            fnames = file_config.get("normalized_data").get('name')
-
-            for file in fnames:
-                logger.debug(f"Reading config settings for file: {file_name}")
-                filepath = SEED_ETL_DIR / file
+                save_terminology(resolved_uri, request_body, max_workers=args.concurrency)
 
             if args.action == 'delete':
-                request_body = format_for_loc(filepath)
                 logger.debug(f'Deleting from Terminology {file_name}')
-                delete_codes(resolved_uri, request_body)
-
-
+                delete_codes(resolved_uri, request_body, max_workers=args.concurrency)
 
     logger.info(f'COMPLETED {args.action}')
 if __name__ == "__main__":
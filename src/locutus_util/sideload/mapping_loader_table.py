@@ -12,8 +12,9 @@ from locutus.model.table import Table
 from locutus.model.user_input import MappingConversations
 from locutus.model.terminology import Terminology as Term, CodingMapping
 from locutus_util.helpers import update_gcloud_project, set_logging_config, load_ontology_lookup
+from locutus_util.system_normalizer import SystemNormalizer
 
-from locutus_util.common import LOGS_PATH, LOCUTUS_SYSTEM_MAP_PATH
+from locutus_util import LOGS_PATH, LOCUTUS_SYSTEM_MAP_PATH
 
 locutus_project = {
     "DEV": "locutus-dev",
@@ -25,7 +26,8 @@ locutus_project = {
 
 def process_csv(file, table):
 
-    system_lookup = load_ontology_lookup()
+    # Only curies in the lookup are remapped. The remediation aliases(ex. LOINC) are not applied to user csvs.
+    normalizer = SystemNormalizer(load_ontology_lookup(), aliases={})
     # Build a lookup that we can use to map the variable names to
     # their respective terminologies
     enumerations = {}
@@ -60,11 +62,12 @@ def process_csv(file, table):
 
         system = row.get("system")
         # Get and clean system
-        if system in system_lookup:
+        normalized_system = normalizer.normalize(system, default=None)
+        if normalized_system is not None and normalized_system != system:
             original_system = system
-            system = system_lookup[system]
+            system = normalized_system
             logging.info(f"Enum {source_enumeration}. Remapped system {original_system} to: {system}")
-        if system not in system_lookup.values():
+        if not normalizer.is_valid(system):
             logging.warning(f'Invalid system for enum {source_enumeration}. "{system}" not found in the lookup file {LOCUTUS_SYSTEM_MAP_PATH}')
 
         codes = [x.strip() for x in row["code"].split(",")]
@@ -0,0 +1,191 @@
+"""
+Read-only stand-in for a Firestore client, backed by a firestore_to_json export.
+
+The analysis and remediation scans take a `db` argument. Passing a SnapshotClient
+instead of a firestore.Client runs them against a local export, so the scan logic
+can be iterated on without any Firestore reads.
+
+Supports the read calls the scans use: collection(), collections(), document(),
+collection_group(), list_documents(), stream(), select() and get_partitions().
+Writes raise SnapshotReadOnlyError.
+
+Export layout(see data_sync/firestore_to_json.py):
+    {"collections": {collection: {doc_id: {...fields, "subcollections": {name: {doc_id: fields}}}}}}
+
+Differences from Firestore: documents that only exist as parents of subcollections
+are not in an export, so list_documents() does not return them.
+
+Usage:
+    db = open_database(snapshot="firestore_backup.json")
+    missing = scan(db, issue_log_path)
+"""
+
+import copy
+import json
+from pathlib import Path
+from locutus_util import logger
+
+SUBCOLLECTIONS_KEY = "subcollections"
+
+
+class SnapshotReadOnlyError(RuntimeError):
+    """Raised when a scan tries to write to a snapshot."""
+
+
+class SnapshotDocument:
+    """Acts as both the DocumentReference and the DocumentSnapshot of an exported document."""
+
+    def __init__(self, parent, doc_id, data):
+        self.id = doc_id
+        self.parent = parent
+        self.path = f"{parent.path}/{doc_id}"
+        self.exists = True
+        self.update_time = None  # Not in an export, so plans from a snapshot have no preconditions
+        self._data = {key: value for key, value in data.items() if key != SUBCOLLECTIONS_KEY}
+        self._subcollections = {
+            name: SnapshotCollection(name, documents, parent=self)
+            for name, documents in (data.get(SUBCOLLECTIONS_KEY) or {}).items()
+        }
+
+    @property
+    def reference(self):
+        return self
+
+    def to_dict(self):
+        # Callers modify the returned data before writing it back
+        return copy.deepcopy(self._data)
+
+    def get(self, field_paths=None, **kwargs):
+        return self.select(field_paths) if field_paths else self
+
+    def select(self, field_paths):
+        """A copy of the document with only the given top-level fields."""
+        projected = copy.copy(self)
+        projected._data = {key: self._data[key] for key in field_paths if key in self._data}
+        return projected
+
+    def collection(self, collection_id):
+        return self._subcollections.get(collection_id) or SnapshotCollection(collection_id, {}, parent=self)
+
+    def collections(self, **kwargs):
+        return iter(list(self._subcollections.values()))
+
+    def set(self, *args, **kwargs):
+        raise SnapshotReadOnlyError(f"Cannot write {self.path}, the database is a snapshot")
+
+    update = set
+    delete = set
+
+
+class SnapshotQuery:
+    """Documents from one collection, or from every collection with the same id."""
+
+    def __init__(self, documents, field_paths=None):
+        self._documents = documents
+        self._field_paths = field_paths
+
+    def select(self, field_paths):
+        return SnapshotQuery(self._documents, list(field_paths))
+
+    def stream(self, **kwargs):
+        for document in self._documents:
+            yield document.select(self._field_paths) if self._field_paths else document
+
+    def get(self, **kwargs):
+        return list(self.stream())
+
+    def get_partitions(self, partition_count, **kwargs):
+        """Split the documents into at most `partition_count` partitions."""
+        size = max(1, -(-len(self._documents) // max(1, partition_count)))
+        for start in range(0, len(self._documents), size):
+            yield SnapshotPartition(SnapshotQuery(self._documents[start:start + size], self._field_paths))
+
+
+class SnapshotPartition:
+    def __init__(self, query):
+        self._query = query
+
+    def query(self):
+        return self._query
+
+
+class SnapshotCollection(SnapshotQuery):
+    def __init__(self, collection_id, documents, parent=None):
+        self.id = collection_id
+        self.parent = parent
+        self.path = f"{parent.path}/{collection_id}" if parent is not None else collection_id
+        self._by_id = {
+            doc_id: SnapshotDocument(self, doc_id, data or {})
+            for doc_id, data in documents.items()
+        }
+        super().__init__(list(self._by_id.values()))
+
+    def document(self, doc_id):
+        if doc_id not in self._by_id:
+            raise KeyError(f"{self.path}/{doc_id} is not in the snapshot")
+        return self._by_id[doc_id]
+
+    def list_documents(self, page_size=None, **kwargs):
+        return iter(list(self._documents))
+
+
+class SnapshotClient:
+    """
+    Args:
+        path (Path): A firestore_to_json export.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "r", encoding="utf-8") as snapshot_file:
+            export = json.load(snapshot_file)
+
+        self._collections = {
+            name: SnapshotCollection(name, documents or {})
+            for name, documents in export.get("collections", {}).items()
+        }
+        logger.info(
+            f"Loaded snapshot {self.path}: "
+            + ", ".join(f"{name} ({len(coll._documents)} documents)" for name, coll in self._collections.items())
+        )
+
+    def collection(self, collection_id):
+        return self._collections.get(collection_id) or SnapshotCollection(collection_id, {})
+
+    def collections(self, **kwargs):
+        return iter(list(self._collections.values()))
+
+    def collection_group(self, collection_id):
+        documents = [
+            document
+            for collection in self._collections.values()
+            for parent in collection._documents
+            for document in parent.collection(collection_id)._documents
+        ]
+        return SnapshotQuery(documents)
+
+    def document(self, *path):
+        segments = "/".join(path).split("/")
+        reference = self.collection(segments[0])
+        for index, segment in enumerate(segments[1:]):
+            reference = reference.document(segment) if index % 2 == 0 else reference.collection(segment)
+        return reference
+
+    def batch(self):
+        raise SnapshotReadOnlyError(f"Cannot write to {self.path}, the database is a snapshot")
+
+    def bulk_writer(self, **kwargs):
+        raise SnapshotReadOnlyError(f"Cannot write to {self.path}, the database is a snapshot")
+
+
+def open_database(project_id=None, database=None, snapshot=None):
+    """
+    The database for a scan: a firestore.Client, or a read-only SnapshotClient if a
+    snapshot export is given.
+    """
+    if snapshot:
+        return SnapshotClient(snapshot)
+
+    from google.cloud import firestore
+
+    return firestore.Client(project=project_id, database=database)
@@ -0,0 +1,141 @@
+"""
+Content-addressed cache for the outputs of pipeline stages.
+
+Each stage is keyed by a hash of its inputs: file digests, option values, and the
+keys of the stages it depends on. When a run finds a stored result for the key,
+the stage is skipped. Since a stage's key goes into the keys of the stages after
+it, a changed input reruns only the stages downstream of it.
+
+Stages that write files list them as outputs. The digests of those files are
+stored with the result, and the stage reruns if the files were changed or removed.
+
+Results are pickled to data/cache/stages. Only the most recent entries of each
+stage are kept.
+
+Usage:
+    stages = StageCache()
+    data, data_key = stages.run("load", {"source": file_digest(path)}, lambda: load(path))
+    stages.run("write", {"data": data_key}, lambda: write(data, out), outputs=[out])
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+import threading
+from pathlib import Path
+from locutus_util import logger, CACHE_PATH
+
+STAGE_CACHE_PATH = CACHE_PATH / "stages"
+STAGE_CACHE_VERSION = 1
+KEEP_ENTRIES = 5  # Entries kept per stage
+
+
+def digest(value):
+    """sha256 of a JSON serializable value, independent of key order."""
+    encoded = json.dumps(value, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def file_digest(path):
+    """sha256 of a file's bytes. None if the file does not exist."""
+    try:
+        return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+class StageCache:
+    """
+    Args:
+        path (Path): Directory of the stored results.
+        enabled (bool): If False every stage runs, and nothing is stored.
+    """
+
+    def __init__(self, path=STAGE_CACHE_PATH, enabled=True):
+        self.path = Path(path)
+        self.enabled = enabled
+
+    def stage_key(self, name, inputs):
+        import pandas as pd
+
+        # Pickled results depend on the Python and pandas versions
+        return digest({
+            "stage": name,
+            "inputs": inputs,
+            "version": STAGE_CACHE_VERSION,
+            "python": sys.version_info[:2],
+            "pandas": pd.__version__,
+        })
+
+    def run(self, name, inputs, func, outputs=()):
+        """
+        Return the stored result of a stage, or run it.
+
+        Args:
+            name (str): Stage name.
+            inputs (dict): Everything the result depends on. Must be JSON serializable.
+            func (callable): Runs the stage. Its return value must be picklable.
+            outputs (list): Files written by the stage.
+
+        Returns:
+            tuple: (result, stage key). Pass the key as an input of later stages.
+        """
+        key = self.stage_key(name, inputs)
+        entry_path = self.path / f"{name}-{key[:32]}.pkl"
+
+        if self.enabled:
+            entry = self._load(entry_path)
+            if entry is not None and all(
+                file_digest(output) == output_digest
+                for output, output_digest in entry["outputs"].items()
+            ):
+                logger.info(f"Stage {name}: unchanged inputs, using the cached result")
+                # Recently used entries are the ones kept by _prune
+                os.utime(entry_path)
+                return entry["value"], key
+
+        logger.info(f"Stage {name}: running")
+        value = func()
+
+        if self.enabled:
+            self._save(entry_path, {
+                "value": value,
+                "outputs": {str(output): file_digest(output) for output in outputs},
+            })
+            self._prune(name)
+
+        return value, key
+
+    def _load(self, entry_path):
+        try:
+            with open(entry_path, "rb") as entry_file:
+                return pickle.load(entry_file)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable stage cache entry {entry_path}: {e}")
+            return None
+
+    def _save(self, entry_path, entry):
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            # Unique per writer, as runs in other threads may save the same entry
+            tmp_path = entry_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, "wb") as entry_file:
+                pickle.dump(entry, entry_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, entry_path)
+        except (OSError, pickle.PicklingError) as e:
+            logger.warning(f"Could not write stage cache entry {entry_path}: {e}")
+
+    def _prune(self, name):
+        try:
+            entries = sorted(
+                self.path.glob(f"{name}-*.pkl"), key=lambda entry: entry.stat().st_mtime, reverse=True
+            )
+            for entry in entries[KEEP_ENTRIES:]:
+                entry.unlink(missing_ok=True)
+        except FileNotFoundError:
+            # Pruned by another run at the same time
+            pass
@@ -0,0 +1,147 @@
+"""
+Infers the system(ontology short name) of a code from its prefix.
+
+The prefixes are compiled once into a trie, and a code is matched against the
+longest prefix it starts with, so 'MAXO:0000001' is MAXO rather than MA.
+
+Prefixes come from two places:
+- CODE_PREFIXES, matched on the code prefix alone(ex. 'LA6576-8' is LOINC).
+- The curies in locutus_system_map.csv. A curie only matches when it is followed
+  by a separator(ex. 'MONDO:0005148' or 'MONDO_0005148'), so 'GO' does not match
+  'GOLGA1'.
+
+Usage:
+    from locutus_util.system_inference import get_system_index
+    get_system_index().classify(["HP:0001250", "LA6576-8", "12345"])
+    > ['HP', 'LOINC', 'UNKNOWN']
+"""
+
+import threading
+
+UNKNOWN_SYSTEM = "UNKNOWN"
+CURIE_SEPARATORS = frozenset(":_")
+
+# Code prefix > system, matched without a separator
+CODE_PREFIXES = {
+    "SNOMED": "SNOMED",
+    "LA": "LOINC",
+    "LP": "LOINC",
+    "MTH": "MIM",
+    "XAO": "XAO",
+    "ZFA": "ZFA",
+    "UBERON": "UBERON",
+    "SO": "SO",
+    "OMIT": "OMIT",
+    "OBA": "OBA",
+    "NCIT": "NCIT",
+    "MA": "MA",
+    "HP": "HP",
+    "FMA": "FMA",
+    "BTO": "BTO",
+    "ExO": "ExO",
+    "EMAPA": "EMAPA",
+    "CL": "CL",
+    "LEPAO": "LEPAO",
+    "NCRO": "NCRO",
+    "OARCS": "OARCS",
+}
+
+
+class _Node:
+    __slots__ = ("children", "system", "separated_system")
+
+    def __init__(self):
+        self.children = {}
+        self.system = None  # Matches on the prefix alone
+        self.separated_system = None  # Matches only if a separator follows
+
+
+class PrefixIndex:
+    """Longest-prefix match of codes to systems."""
+
+    def __init__(self):
+        self._root = _Node()
+        self.size = 0
+
+    def add(self, prefix, system, require_separator=False):
+        """
+        Args:
+            prefix (str): Code prefix.
+            system (str): System of the codes starting with the prefix.
+            require_separator (bool): Only match when the prefix is followed by ':' or '_'.
+        """
+        node = self._root
+        for char in prefix:
+            node = node.children.setdefault(char, _Node())
+        if require_separator:
+            node.separated_system = node.separated_system or system
+        else:
+            node.system = node.system or system
+        self.size += 1
+
+    def lookup(self, code, default=UNKNOWN_SYSTEM):
+        """The system of the longest matching prefix, or `default`."""
+        if not code:
+            return None
+
+        found = default
+        node = self._root
+        length = len(code)
+        for index, char in enumerate(code):
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.system is not None:
+                found = node.system
+            elif node.separated_system is not None and index + 1 < length and code[index + 1] in CURIE_SEPARATORS:
+                found = node.separated_system
+        return found
+
+    def classify(self, codes, default=UNKNOWN_SYSTEM):
+        """
+        Returns:
+            list: The system of each code, in order. Codes seen before are not matched again.
+        """
+        systems = {}
+        lookup = self.lookup
+        return [
+            systems[code] if code in systems else systems.setdefault(code, lookup(code, default))
+            for code in codes
+        ]
+
+
+def build_system_index(code_prefixes=CODE_PREFIXES, curies=()):
+    """
+    Args:
+        code_prefixes (dict): Code prefix > system, matched without a separator.
+        curies (iterable): Curies matched when followed by a separator. Each is its own system.
+
+    Returns:
+        PrefixIndex
+    """
+    index = PrefixIndex()
+    for prefix, system in code_prefixes.items():
+        index.add(prefix, system)
+    for curie in curies:
+        if isinstance(curie, str) and curie.strip():
+            index.add(curie.strip(), curie.strip(), require_separator=True)
+    return index
+
+
+_default = (None, None)  # (system map it was built from, index)
+_default_lock = threading.Lock()
+
+
+def get_system_index():
+    """
+    The index for CODE_PREFIXES and the curies of locutus_system_map.csv. It is
+    rebuilt only when the system map changes.
+    """
+    global _default
+    from locutus_util.reference_data import get_system_map
+
+    system_map = get_system_map()
+    with _default_lock:
+        if _default[0] is not system_map:
+            _default = (system_map, build_system_index(CODE_PREFIXES, system_map))
+        return _default[1]
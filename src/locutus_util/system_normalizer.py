@@ -0,0 +1,100 @@
+"""
+Normalizes ontology short names(curies) into the system urls stored in mappings.
+
+Built once from a curie > system lookup(ex. reference_data.get_ontology_api_systems
+or get_system_map), plus SYSTEM_ALIASES for short names that are not in the lookup
+as they are. Every check is a dict or set lookup.
+
+Usage:
+    from locutus_util.system_normalizer import get_normalizer
+    normalizer = get_normalizer(get_ontology_api_systems())
+    normalizer.normalize("LOINC")
+    > 'https://loinc.org/'
+    normalizer.is_valid("https://loinc.org/")
+    > True
+"""
+
+import threading
+
+UNKNOWN_SYSTEM = "UNKNOWN"
+
+# Short names used in mappings that are not in the lookup as they are > their curie
+SYSTEM_ALIASES = {
+    "LOINC": "LNC",
+    "MIM": "OMIM",
+    "MeSH": "MSH",
+    "MESH": "MSH",
+}
+
+# Short names found in mapping systems, in place of a system url
+SHORT_SYSTEM_NAMES = frozenset([
+    "BTO", "CL", "CLO", "EMAPA",
+    "ExO", "FMA", "HP", "HPO",
+    "LEPAO", "LOINC", "MA", "OMIM",
+    "MONDO", "MSH", "MeSH", "NCIT",
+    "NCRO", "OARCS", "OBA",
+    "OMIT", "ORPHANET", "SNOMED", "SO",
+    "UBERON", "UK Biobank", "XAO", "ZFA",
+    "MIM", "ORDO",
+])
+
+
+class SystemNormalizer:
+    """
+    Args:
+        curie_systems (dict): curie > system url.
+        aliases (dict): Short name > curie, used when the name is not a curie itself.
+    """
+
+    def __init__(self, curie_systems, aliases=SYSTEM_ALIASES):
+        self.curie_systems = dict(curie_systems)
+        self.valid_systems = frozenset(self.curie_systems.values())
+
+        # Short name > system url, with the aliases resolved up front
+        self._systems = {
+            alias: self.curie_systems[curie]
+            for alias, curie in aliases.items()
+            if curie in self.curie_systems
+        }
+        self._systems.update(self.curie_systems)
+
+    def is_curie(self, name):
+        return name in self.curie_systems
+
+    def is_valid(self, system):
+        """True if the system is a known system url."""
+        return system in self.valid_systems
+
+    def normalize(self, name, default=UNKNOWN_SYSTEM):
+        """
+        The system url for a curie or alias. Known system urls are returned as they are.
+
+        Returns:
+            str: The system url, `default` if unknown, or None if `name` is empty.
+        """
+        if not name:
+            return None
+        system = self._systems.get(name)
+        if system is not None:
+            return system
+        return name if name in self.valid_systems else default
+
+    def normalize_many(self, names, default=UNKNOWN_SYSTEM):
+        """The system url for each name, in order."""
+        return [self.normalize(name, default) for name in names]
+
+
+_default = (None, None)  # (lookup it was built from, normalizer)
+_default_lock = threading.Lock()
+
+
+def get_normalizer(curie_systems):
+    """
+    A normalizer for the lookup. The last one built is reused while the same lookup
+    object is passed(reference_data returns the same object until its file changes).
+    """
+    global _default
+    with _default_lock:
+        if _default[0] is not curie_systems:
+            _default = (curie_systems, SystemNormalizer(curie_systems))
+        return _default[1]